@@ -0,0 +1,334 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: misses are only coalesced within a process
+    fcntl = None
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+
+# FBref only updates its league tables after matchdays, so a few hours of
+# freshness is plenty; stale entries may still be served for a day while a
+# background refresh runs.
+DEFAULT_TTL = int(os.environ.get("PL_CACHE_TTL", 6 * 60 * 60))
+DEFAULT_STALE_TTL = int(os.environ.get("PL_CACHE_STALE_TTL", 24 * 60 * 60))
+# Longest a miss waits for another caller's fetch before fetching itself
+FETCH_WAIT = float(os.environ.get("PL_FETCH_WAIT", 120))
+
+# Cache directories already reported as unsafe; each is logged once per process
+_refused_dirs = set()
+_refused_dirs_lock = threading.Lock()
+
+
+def default_cache_dir():
+    """Directory for on-disk cache files (/tmp is the only writable path on Vercel)."""
+    return os.environ.get(
+        "PL_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), "pl-predictor-cache")
+    )
+
+
+def ensure_private_dir(path):
+    """Create ``path`` (mode 0700) and check that no other user can plant files in it.
+
+    Cache files are unpickled, so a directory another local user controls
+    would let them run code here. Raises OSError when ``path`` is not a
+    directory owned by this user, or when a parent is owned by someone else
+    (other than root) or writable by others without the sticky bit.
+    """
+    path = os.path.abspath(path)
+    missing = []
+    head = path
+    while not os.path.lexists(head):
+        missing.append(head)
+        head = os.path.dirname(head)
+    for directory in reversed(missing):
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+
+    if not hasattr(os, "getuid"):
+        # Windows: no POSIX owners or modes to check
+        return path
+    uid = os.getuid()
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != uid:
+        raise OSError(f"{path} is not a directory owned by this user")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+    parent = os.path.dirname(path)
+    while True:
+        st = os.stat(parent)
+        shared = st.st_mode & 0o022 and not st.st_mode & stat.S_ISVTX
+        if st.st_uid not in (uid, 0) or shared:
+            raise OSError(f"{parent} can be modified by other users")
+        if os.path.dirname(parent) == parent:
+            return path
+        parent = os.path.dirname(parent)
+
+
+class CacheEntry:
+    __slots__ = ("value", "fetched_at", "ttl", "stale_ttl")
+
+    def __init__(self, value, fetched_at, ttl, stale_ttl):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def is_fresh(self):
+        return self.age() < self.ttl
+
+    def is_usable(self):
+        """Fresh, or stale but still inside the stale-while-revalidate window."""
+        return self.age() < self.ttl + self.stale_ttl
+
+
+class _Flight:
+    """The latest fetch of one key in this process."""
+    __slots__ = ("lock", "finished_at", "value")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.finished_at = None
+        self.value = None
+
+
+class TableCache:
+    """In-memory + on-disk cache of parsed tables, keyed by URL.
+
+    Fresh entries are returned directly. Stale entries inside the
+    stale-while-revalidate window are returned immediately while a single
+    background thread refetches them. Anything older is fetched inline.
+
+    Fetches are single-flight per key: concurrent misses in this process,
+    and in other processes sharing the cache directory (via a lock file),
+    wait for one fetch and share its result.
+    """
+
+    def __init__(self, namespace, cache_dir=None, default_ttl=DEFAULT_TTL,
+                 default_stale_ttl=DEFAULT_STALE_TTL):
+        self.namespace = namespace
+        self.cache_dir = os.path.join(cache_dir or default_cache_dir(), namespace)
+        self.default_ttl = default_ttl
+        self.default_stale_ttl = default_stale_ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._flights = {}
+        self._dir_checked = False
+
+    def get_or_fetch(self, key, fetch, ttl=None, stale_ttl=None):
+        """Return the cached value for ``key``, calling ``fetch()`` on a miss.
+
+        ``fetch`` results of ``None`` are treated as failures and not cached.
+        """
+        entry = self.get_entry(key)
+        if entry is not None:
+            if entry.is_fresh():
+                telemetry.count("cache", f"{self.namespace}:hit")
+                return entry.value
+            if entry.is_usable():
+                telemetry.count("cache", f"{self.namespace}:stale")
+                self._refresh_in_background(key, fetch, ttl, stale_ttl)
+                return entry.value
+
+        telemetry.count("cache", f"{self.namespace}:miss")
+        return self._fetch_once(key, fetch, ttl, stale_ttl)
+
+    def _fetch_once(self, key, fetch, ttl=None, stale_ttl=None):
+        """Call ``fetch()`` for ``key`` unless a concurrent caller just did.
+
+        Callers queue on a per-key lock (and a per-key lock file across
+        processes); whoever gets it after another fetch finished returns
+        that fetch's result instead of fetching again.
+        """
+        started = time.time()
+        with self._lock:
+            flight = self._flights.setdefault(key, _Flight())
+
+        if not flight.lock.acquire(timeout=FETCH_WAIT):
+            print(f"Gave up waiting for the fetch of {key}, fetching it again")
+            return self._fetch_and_store(key, fetch, ttl, stale_ttl)
+        try:
+            if flight.finished_at is not None and flight.finished_at >= started:
+                return flight.value
+            with self._file_lock(key):
+                # Another process may have fetched it while we waited
+                entry = self._read_disk(key)
+                if entry is not None and entry.fetched_at >= started:
+                    with self._lock:
+                        self._memory[key] = entry
+                    value = entry.value
+                else:
+                    value = self._fetch_and_store(key, fetch, ttl, stale_ttl)
+            flight.value, flight.finished_at = value, time.time()
+            return value
+        finally:
+            flight.lock.release()
+
+    def _fetch_and_store(self, key, fetch, ttl, stale_ttl):
+        value = fetch()
+        if value is not None:
+            self.put(key, value, ttl, stale_ttl)
+        return value
+
+    @contextmanager
+    def _file_lock(self, key):
+        """Hold this key's lock file (best effort: no lock where flock or the disk is unavailable)."""
+        if fcntl is None:
+            yield
+            return
+        try:
+            f = open(os.path.join(self._private_dir(), f"{self._digest(key)}.lock"), "a")
+        except OSError:
+            yield
+            return
+
+        with f:
+            locked = False
+            deadline = time.monotonic() + FETCH_WAIT
+            while not locked:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        print(f"Gave up waiting for another process to fetch {key}")
+                        break
+                    time.sleep(0.05)
+                except OSError:
+                    break
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_entry(self, key):
+        """Return the raw entry for ``key`` from memory or disk, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            with self._lock:
+                self._memory.setdefault(key, entry)
+        return entry
+
+    def put(self, key, value, ttl=None, stale_ttl=None, fetched_at=None):
+        entry = CacheEntry(
+            value,
+            fetched_at if fetched_at is not None else time.time(),
+            self.default_ttl if ttl is None else ttl,
+            self.default_stale_ttl if stale_ttl is None else stale_ttl,
+        )
+        with self._lock:
+            self._memory[key] = entry
+        self._write_disk(key, entry)
+        return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._memory)
+            self._memory.clear()
+        for key in keys:
+            self.invalidate(key)
+
+    def _refresh_in_background(self, key, fetch, ttl, stale_ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_once(key, fetch, ttl, stale_ttl)
+            except Exception as e:
+                print(f"Background refresh of {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _private_dir(self):
+        """The cache directory, once checked with ``ensure_private_dir`` (raises OSError)."""
+        if not self._dir_checked:
+            ensure_private_dir(self.cache_dir)
+            self._dir_checked = True
+        return self.cache_dir
+
+    def _digest(self, key):
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{self._digest(key)}.pkl")
+
+    def _read_disk(self, key):
+        if not os.path.exists(self._path(key)):
+            return None
+        try:
+            self._private_dir()
+        except OSError as e:
+            with _refused_dirs_lock:
+                first = self.cache_dir not in _refused_dirs
+                _refused_dirs.add(self.cache_dir)
+            if first:
+                print(f"Not reading the disk cache in {self.cache_dir}: {e}")
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                stored = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable cache file for {key}: {e}")
+            return None
+
+        if stored.get("key") != key:
+            return None
+        return CacheEntry(stored["value"], stored["fetched_at"],
+                          stored["ttl"], stored["stale_ttl"])
+
+    def _write_disk(self, key, entry):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._private_dir(), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({
+                    "key": key,
+                    "value": entry.value,
+                    "fetched_at": entry.fetched_at,
+                    "ttl": entry.ttl,
+                    "stale_ttl": entry.stale_ttl,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Could not write cache file for {key}: {e}")
@@ -0,0 +1,179 @@
+import atexit
+import os
+import queue
+import threading
+import sys
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+
+DEFAULT_POOL_SIZE = int(os.environ.get("PL_DRIVER_POOL_SIZE", 3))
+# Recycle a browser after this many pages to cap memory growth
+DEFAULT_MAX_PAGES = int(os.environ.get("PL_DRIVER_MAX_PAGES", 50))
+# Give up on a page whose stats table hasn't appeared after this many seconds
+PAGE_TIMEOUT = float(os.environ.get("PL_BROWSER_TIMEOUT", 20))
+
+# Requests the squad tables don't need: images, fonts, media, stylesheets,
+# ads and trackers. Extra patterns go in PL_BROWSER_BLOCK, comma-separated.
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm", "*.css",
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*adservice.google.*", "*amazon-adsystem.com*",
+    "*adnxs.com*", "*pubmatic.com*", "*rubiconproject.com*", "*criteo.*",
+    "*facebook.net*", "*twitter.com*", "*quantserve.com*", "*scorecardresearch.com*",
+] + [pattern.strip() for pattern in os.environ.get("PL_BROWSER_BLOCK", "").split(",") if pattern.strip()]
+
+# True once a squad stats table is in the page. FBref ships some tables
+# inside HTML comments, which the parser reads too, so those count as well.
+TABLE_READY_SCRIPT = "return document.documentElement.innerHTML.indexOf('id=\"stats_squads') >= 0"
+
+
+def new_chrome_driver():
+    """Initialize Chrome driver with proper options.
+
+    Pages load eagerly (``driver.get`` returns once the HTML is parsed,
+    without waiting for subresources) and ``BLOCKED_URLS`` are never
+    requested.
+    """
+    # Deferred so processes that never open a browser don't pay for selenium
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    opts = Options()
+    opts.page_load_strategy = "eager"
+    opts.add_argument("--headless=new")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--disable-extensions")
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.notifications": 2,
+    })
+    opts.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
+    driver = webdriver.Chrome(options=opts)
+    driver.set_page_load_timeout(PAGE_TIMEOUT)
+    block_urls(driver)
+    return driver
+
+
+def block_urls(driver, patterns=BLOCKED_URLS):
+    """Stop the browser from requesting ``patterns`` (Chrome DevTools; no-op elsewhere)."""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(patterns)})
+    except Exception as e:
+        print(f"Could not block browser requests: {e}")
+
+
+def load_page(driver, url, ready_script=TABLE_READY_SCRIPT, timeout=PAGE_TIMEOUT):
+    """Open ``url`` and return its HTML as soon as ``ready_script`` returns true.
+
+    Raises selenium's TimeoutException when the page never gets ready.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    with telemetry.stage("browser_load"):
+        driver.get(url)
+    with telemetry.stage("browser_wait"):
+        # With the eager strategy the table is usually there already
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: d.execute_script(ready_script))
+    return driver.page_source
+
+
+class _PooledDriver:
+    __slots__ = ("driver", "pages")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class ChromeDriverPool:
+    """Bounded pool of long-lived headless Chrome drivers.
+
+    Drivers are created lazily up to ``max_size`` and handed out with
+    ``with pool.driver() as driver:``. A driver is health-checked before each
+    checkout, and is quit instead of returned once it has served
+    ``max_pages`` pages or when the borrower raised while using it.
+    """
+
+    def __init__(self, factory=new_chrome_driver, max_size=DEFAULT_POOL_SIZE,
+                 max_pages=DEFAULT_MAX_PAGES):
+        self._factory = factory
+        self.max_size = max_size
+        self.max_pages = max_pages
+        # LIFO so the most recently used (warmest) browser is reused first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closed = False
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """Borrow a driver, blocking while all ``max_size`` drivers are in use."""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No Chrome driver available in the pool")
+        try:
+            pooled = self._checkout()
+            try:
+                yield pooled.driver
+            except BaseException:
+                # The page or the browser may be in a broken state
+                self._discard(pooled)
+                raise
+            else:
+                pooled.pages += 1
+                self._checkin(pooled)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Quit every idle driver; checked-out drivers are quit on return."""
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(pooled)
+
+    def _checkout(self):
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                with telemetry.stage("chrome_start"):
+                    return _PooledDriver(self._factory())
+            if self._is_healthy(pooled):
+                return pooled
+            self._discard(pooled)
+
+    def _checkin(self, pooled):
+        if self._closed or pooled.pages >= self.max_pages:
+            self._discard(pooled)
+        else:
+            self._idle.put(pooled)
+
+    def _is_healthy(self, pooled):
+        try:
+            # Round-trips to the browser; raises if Chrome or chromedriver died
+            pooled.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+
+
+# Shared by every scraper in this process
+driver_pool = ChromeDriverPool()
+atexit.register(driver_pool.close)
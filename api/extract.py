@@ -0,0 +1,146 @@
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from lxml import html as lxml_html
+
+_TABLE_OPEN = re.compile(r'<table\b[^>]*>', re.IGNORECASE)
+_TABLE_ID = re.compile(r'\bid="([^"]*)"')
+_TABLE_CLOSE = re.compile(r'</table\s*>', re.IGNORECASE)
+
+# FBref squad tables: stats_squads_passing_for, stats_squads_keepers_for, ...
+SQUAD_TABLE_PREFIX = "stats_squads_"
+
+# Body rows that are repeated headers or visual spacers rather than data
+_SKIP_ROW_CLASSES = ("thead", "over_header", "spacer")
+
+
+def find_table_html(html, match="Squad", table_id=None):
+    """Return the markup of the wanted table without parsing the page.
+
+    FBref ships most tables inside HTML comments, so this scans the raw
+    text. With ``table_id`` that exact table is returned; otherwise squad
+    tables (``stats_squads_*``) are preferred over other tables, in page
+    order, and the first one containing ``match`` wins.
+    """
+    squad_tables, other_tables = [], []
+    for opening in _TABLE_OPEN.finditer(html):
+        id_match = _TABLE_ID.search(opening.group(0))
+        current_id = id_match.group(1) if id_match else ""
+        if table_id is not None and current_id != table_id:
+            continue
+        (squad_tables if current_id.startswith(SQUAD_TABLE_PREFIX) else other_tables).append(opening.start())
+
+    for start in squad_tables + other_tables:
+        closing = _TABLE_CLOSE.search(html, start)
+        if closing is None:
+            continue
+        fragment = html[start:closing.end()]
+        if match is None or match in fragment:
+            return fragment
+
+    raise ValueError(f"No table found matching '{match}'")
+
+
+def _cell_text(cell):
+    return " ".join(cell.text_content().split())
+
+
+def _header_signature(header_rows):
+    """(group, label) per column, expanding over-header colspans."""
+    labels = [_cell_text(cell) for cell in header_rows[-1]]
+    groups = [""] * len(labels)
+    if len(header_rows) > 1:
+        position = 0
+        for cell in header_rows[-2]:
+            span = int(cell.get("colspan", 1) or 1)
+            for k in range(position, min(position + span, len(labels))):
+                groups[k] = _cell_text(cell)
+            position += span
+    return tuple(zip(groups, labels))
+
+
+@lru_cache(maxsize=64)
+def compile_schema(signature, rename=()):
+    """Column names for a header layout, computed once per distinct layout.
+
+    Grouped columns become ``Group_Label``; ungrouped ones keep their label
+    (``Squad``, ``Ast``, ``PrgP``). Duplicates get ``.1``, ``.2`` suffixes,
+    and ``rename`` is a tuple of (name, new_name) pairs applied last.
+    """
+    names, seen = [], {}
+    for group, label in signature:
+        name = f"{group}_{label}" if group else label
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+
+    renames = dict(rename)
+    return tuple(renames.get(name, name) for name in names)
+
+
+def _to_numeric(values):
+    """Convert a column of cell strings to an int/float array when every non-empty cell is numeric."""
+    numbers = []
+    integral = True
+    for value in values:
+        if value == "":
+            numbers.append(math.nan)
+            integral = False
+            continue
+        value = value.replace(",", "")
+        try:
+            numbers.append(int(value))
+        except ValueError:
+            try:
+                numbers.append(float(value))
+            except ValueError:
+                return values
+            integral = False
+
+    if not numbers or len(numbers) == numbers.count(math.nan):
+        return values
+    return np.array(numbers, dtype=np.int64 if integral else np.float64)
+
+
+def parse_table(table_html, rename=None):
+    """Parse one table's markup into a DataFrame with flattened column names."""
+    table = lxml_html.fragment_fromstring(table_html)
+    thead = table.find("thead")
+    header_rows = list(thead.iter("tr")) if thead is not None else []
+
+    body_rows = []
+    for row in table.iter("tr"):
+        if thead is not None and row.getparent() is thead:
+            continue
+        classes = row.get("class", "").split()
+        if any(cls in _SKIP_ROW_CLASSES for cls in classes):
+            continue
+        body_rows.append([_cell_text(cell) for cell in row if cell.tag in ("td", "th")])
+
+    if not header_rows:
+        if not body_rows:
+            raise ValueError("Table has no header")
+        # No <thead>: the first row holds the labels
+        header_rows = [next(table.iter("tr"))]
+        body_rows = body_rows[1:]
+
+    schema = compile_schema(_header_signature(header_rows), tuple(sorted((rename or {}).items())))
+    width = len(schema)
+    rows = [(row + [""] * width)[:width] for row in body_rows]
+
+    columns = list(zip(*rows)) if rows else [()] * width
+    data = {}
+    for name, values in zip(schema, columns):
+        data[name] = _to_numeric(list(values)) if name != "Squad" else list(values)
+    return pd.DataFrame(data)
+
+
+def extract_table(html, match="Squad", table_id=None, rename=None):
+    """Find and parse only the wanted stats table of a page."""
+    return parse_table(find_table_html(html, match=match, table_id=table_id), rename=rename)
@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+from cache import TableCache
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+HTTP_TIMEOUT = float(os.environ.get("PL_HTTP_TIMEOUT", 10))
+HTTP_POOL_SIZE = int(os.environ.get("PL_HTTP_POOL_SIZE", 8))
+
+# FBref squad tables have ids like "stats_squads_passing_for"; a page without
+# one is usually a bot-check or error page.
+_STATS_TABLE_RE = re.compile(r'<table[^>]*\bid="stats_squads_|>Squad</th>')
+
+
+def has_stats_table(html):
+    """Whether the page contains a squad stats table."""
+    return bool(html) and _STATS_TABLE_RE.search(html) is not None
+
+
+def new_session():
+    """A keep-alive session with a connection pool and retries on transient errors."""
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+class FetchResult:
+    __slots__ = ("url", "html", "not_modified", "source")
+
+    def __init__(self, url, html, not_modified=False, source="http"):
+        self.url = url
+        self.html = html
+        # True when the server answered 304 and ``html`` is the stored copy
+        self.not_modified = not_modified
+        self.source = source
+
+
+class FBrefFetcher:
+    """HTTP-first page fetcher shared by the scrapers.
+
+    Requests go through one pooled keep-alive session and are made
+    conditional (If-None-Match / If-Modified-Since) using the validators of
+    the last response, so unchanged pages come back as 304s. ``expect``
+    tells a real page from a bot-check or error page (default: it has a
+    squad stats table); only real pages are stored for revalidation, and a
+    browser is only used, via ``fallback``, when the HTTP response fails it.
+    """
+
+    def __init__(self, session=None, timeout=HTTP_TIMEOUT, validators: TableCache = None):
+        self.session = session or new_session()
+        self.timeout = timeout
+        # Last body + ETag/Last-Modified per URL; kept on disk so cold starts
+        # can still revalidate instead of downloading the page again
+        self.validators = validators or TableCache("http", default_ttl=7 * 24 * 60 * 60,
+                                                   default_stale_ttl=0)
+
+    def fetch(self, url, fallback=None, expect=has_stats_table):
+        """Fetch ``url``, escalating to ``fallback(url) -> html`` if the page fails ``expect``."""
+        try:
+            result = self.fetch_http(url, expect=expect)
+        except requests.RequestException as e:
+            if fallback is None:
+                raise
+            print(f"HTTP fetch of {url} failed ({e}), falling back to browser")
+            result = None
+
+        if result is not None and expect(result.html):
+            return result
+        if fallback is None:
+            if result is None:
+                raise ValueError(f"No response for {url}")
+            return result
+
+        print(f"Unexpected HTTP response for {url}, using browser")
+        telemetry.fallback("browser")
+        return FetchResult(url, fallback(url), source="browser")
+
+    def fetch_http(self, url, expect=has_stats_table):
+        stored = self.validators.get_entry(url)
+        headers = {}
+        if stored is not None:
+            if stored.value.get("etag"):
+                headers["If-None-Match"] = stored.value["etag"]
+            if stored.value.get("last_modified"):
+                headers["If-Modified-Since"] = stored.value["last_modified"]
+
+        try:
+            with telemetry.stage("fetch"):
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            telemetry.count("upstream", "http:error")
+            raise
+        if response.status_code == 304 and stored is not None:
+            telemetry.count("upstream", "http:not_modified")
+            return FetchResult(url, stored.value["html"], not_modified=True)
+
+        telemetry.count("upstream", "http:ok")
+        html = response.text
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if (etag or last_modified) and expect(html):
+            self.validators.put(url, {"etag": etag, "last_modified": last_modified, "html": html})
+        return FetchResult(url, html)
+
+
+# One session (and connection pool) per process
+fetcher = FBrefFetcher()
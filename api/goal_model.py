@@ -0,0 +1,375 @@
+"""Poisson goal model (Dixon-Coles style) fitted from the season's results.
+
+Goals are Poisson with log-rates
+
+    home: intercept + home_advantage + attack[home] + defence[away]
+    away: intercept + attack[away] + defence[home]
+
+and the Dixon-Coles ``rho`` corrects the probabilities of 0-0, 1-0, 0-1
+and 1-1. Fitting is Newton's method on the (ridge-penalised) likelihood,
+warm-started from the previous parameters, so adding a gameweek of results
+usually converges in a couple of iterations.
+
+Fitted parameters are stored in the stats snapshot meta; requests only
+evaluate them. Every refresh.py run refits them; to refit on its own::
+
+    python api/goal_model.py
+"""
+import hashlib
+import math
+import os
+import re
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+FBREF_BASE_URL = os.environ.get("PL_FBREF_BASE_URL", "https://fbref.com").rstrip("/")
+FIXTURES_URL = f"{FBREF_BASE_URL}/en/comps/9/schedule/Premier-League-Scores-and-Fixtures"
+
+# Shrinks attack/defence towards average; keeps early-season fits sane
+DEFAULT_RIDGE = 1.0
+MAX_GOALS = 10
+
+# "2–1"; any dash (or mis-decoded dash) between the goals
+_SCORE = re.compile(r"(\d+)\s*[^\d\s]+\s*(\d+)")
+# The schedule table has an id like "sched_2024-2025_9_1"
+_SCHEDULE_TABLE_RE = re.compile(r'<table[^>]*\bid="sched_')
+
+
+class Match(NamedTuple):
+    home: str
+    away: str
+    home_goals: int
+    away_goals: int
+    date: str = ""
+
+
+def parse_results(df):
+    """Played matches from an FBref scores & fixtures table (rows without a score are skipped)."""
+    matches = []
+    for row in df.to_dict("records"):
+        score = _SCORE.search(str(row.get("Score") or ""))
+        home, away = row.get("Home"), row.get("Away")
+        if score is None or not isinstance(home, str) or not isinstance(away, str):
+            continue
+        matches.append(Match(home, away, int(score.group(1)), int(score.group(2)),
+                             str(row.get("Date") or "")))
+    return matches
+
+
+def parse_remaining(df):
+    """Unplayed (home, away) fixtures from the same table."""
+    fixtures = []
+    for row in df.to_dict("records"):
+        home, away = row.get("Home"), row.get("Away")
+        if not isinstance(home, str) or not isinstance(away, str) or not home or not away:
+            continue
+        if _SCORE.search(str(row.get("Score") or "")) is None:
+            fixtures.append((home, away))
+    return fixtures
+
+
+def season_meta(matches, remaining):
+    """Played results and remaining fixtures, as stored in the snapshot for the simulator."""
+    return {
+        "played": [[m.home, m.away, m.home_goals, m.away_goals] for m in matches],
+        "remaining": [[home, away] for home, away in remaining],
+    }
+
+
+def results_fingerprint(matches):
+    """Identifies a set of results, so an unchanged fixture list skips refitting."""
+    digest = hashlib.sha1()
+    for match in sorted(matches):
+        digest.update("|".join(map(str, match)).encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def _dc_tau(home_goals, away_goals, home_rate, away_rate, rho):
+    """Dixon-Coles low-score adjustment factors (1 outside 0/1 scorelines)."""
+    tau = np.ones(np.broadcast(home_goals, away_goals, home_rate).shape)
+    tau = np.where((home_goals == 0) & (away_goals == 0), 1 - home_rate * away_rate * rho, tau)
+    tau = np.where((home_goals == 0) & (away_goals == 1), 1 + home_rate * rho, tau)
+    tau = np.where((home_goals == 1) & (away_goals == 0), 1 + away_rate * rho, tau)
+    tau = np.where((home_goals == 1) & (away_goals == 1), 1 - rho, tau)
+    return tau
+
+
+class GoalModel:
+    """Fitted parameters, evaluated with a few vector operations per fixture."""
+
+    def __init__(self, teams, attack, defence, intercept, home_advantage, rho=0.0,
+                 matches=0, fingerprint="", iterations=0, fitted_at=None):
+        self.teams = list(teams)
+        self.attack = np.asarray(attack, dtype=float)
+        self.defence = np.asarray(defence, dtype=float)
+        self.intercept = float(intercept)
+        self.home_advantage = float(home_advantage)
+        self.rho = float(rho)
+        self.matches = matches
+        self.fingerprint = fingerprint
+        self.iterations = iterations
+        self.fitted_at = fitted_at if fitted_at is not None else time.time()
+        self.index = {team: i for i, team in enumerate(self.teams)}
+
+        goals = np.arange(MAX_GOALS + 1)
+        self._goals = goals
+        self._log_factorials = np.array([math.lgamma(k + 1) for k in goals])
+
+    @classmethod
+    def from_meta(cls, meta):
+        """Rebuild from ``to_meta()`` output; None when ``meta`` is empty."""
+        if not meta:
+            return None
+        return cls(meta["teams"], meta["attack"], meta["defence"], meta["intercept"],
+                   meta["home_advantage"], meta.get("rho", 0.0), meta.get("matches", 0),
+                   meta.get("fingerprint", ""), meta.get("iterations", 0), meta.get("fitted_at"))
+
+    def to_meta(self):
+        """JSON-serialisable parameters, for the snapshot header."""
+        return {
+            "teams": self.teams,
+            "attack": [round(float(v), 6) for v in self.attack],
+            "defence": [round(float(v), 6) for v in self.defence],
+            "intercept": round(self.intercept, 6),
+            "home_advantage": round(self.home_advantage, 6),
+            "rho": round(self.rho, 6),
+            "matches": self.matches,
+            "fingerprint": self.fingerprint,
+            "iterations": self.iterations,
+            "fitted_at": self.fitted_at,
+        }
+
+    def __contains__(self, team):
+        return team in self.index
+
+    def expected_goals(self, home, away):
+        """(home, away) expected goals; ``home``/``away`` may be names or index arrays."""
+        h = self._indices(home)
+        a = self._indices(away)
+        home_rate = np.exp(self.intercept + self.home_advantage + self.attack[h] + self.defence[a])
+        away_rate = np.exp(self.intercept + self.attack[a] + self.defence[h])
+        return home_rate, away_rate
+
+    def scoreline_probabilities(self, home, away):
+        """(MAX_GOALS+1)^2 grid of P(home scores i, away scores j)."""
+        home_rate, away_rate = (float(rate) for rate in self.expected_goals(home, away))
+        home_pmf = np.exp(self._goals * math.log(home_rate) - home_rate - self._log_factorials)
+        away_pmf = np.exp(self._goals * math.log(away_rate) - away_rate - self._log_factorials)
+        grid = np.outer(home_pmf, away_pmf)
+        grid[:2, :2] *= _dc_tau(self._goals[:2, None], self._goals[None, :2], home_rate, away_rate, self.rho)
+        return grid / grid.sum()
+
+    def predict(self, home, away):
+        """Expected goals, outcome probabilities and the most likely score of one fixture."""
+        home_rate, away_rate = self.expected_goals(home, away)
+        grid = self.scoreline_probabilities(home, away)
+        score = np.unravel_index(int(grid.argmax()), grid.shape)
+        return {
+            "home_goals": float(home_rate),
+            "away_goals": float(away_rate),
+            "home_win": float(np.tril(grid, -1).sum()),
+            "draw": float(np.trace(grid)),
+            "away_win": float(np.triu(grid, 1).sum()),
+            "most_likely_score": [int(score[0]), int(score[1])],
+        }
+
+    def _indices(self, teams):
+        if isinstance(teams, str):
+            return self.index[teams]
+        return np.asarray(teams, dtype=np.intp)
+
+
+def _design(matches, index):
+    """Design matrix and goals: each match gives a home and an away observation."""
+    n = len(index)
+    rows = len(matches)
+    X = np.zeros((2 * rows, 2 + 2 * n))
+    y = np.empty(2 * rows)
+    for r, match in enumerate(matches):
+        h, a = index[match.home], index[match.away]
+        X[2 * r, [0, 1, 2 + h, 2 + n + a]] = 1
+        X[2 * r + 1, [0, 2 + a, 2 + n + h]] = 1
+        y[2 * r], y[2 * r + 1] = match.home_goals, match.away_goals
+    return X, y
+
+
+def _fit_rho(matches, home_rate, away_rate, start=0.0):
+    """Maximise the Dixon-Coles term over rho (golden-section search around ``start``)."""
+    hg = np.array([m.home_goals for m in matches])
+    ag = np.array([m.away_goals for m in matches])
+    low = (hg <= 1) & (ag <= 1)
+    if not low.any():
+        return 0.0
+    hg, ag, hr, ar = hg[low], ag[low], home_rate[low], away_rate[low]
+
+    def loglik(rho):
+        tau = _dc_tau(hg, ag, hr, ar, rho)
+        return -np.inf if (tau <= 0).any() else float(np.log(tau).sum())
+
+    lo, hi = max(start - 0.3, -0.5), min(start + 0.3, 0.5)
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(40):
+        c, d = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        if loglik(c) >= loglik(d):
+            hi = d
+        else:
+            lo = c
+    return (lo + hi) / 2
+
+
+def fit_goal_model(matches, previous=None, ridge=DEFAULT_RIDGE, max_iter=50, tol=1e-6):
+    """Fit attack/defence/home/rho to ``matches``.
+
+    With ``previous`` (a GoalModel) the fit starts from its parameters;
+    teams it has not seen start at average. Returns a new GoalModel.
+    """
+    if not matches:
+        raise ValueError("No played matches to fit")
+
+    teams = sorted({m.home for m in matches} | {m.away for m in matches})
+    index = {team: i for i, team in enumerate(teams)}
+    n = len(teams)
+    X, y = _design(matches, index)
+
+    beta = np.zeros(2 + 2 * n)
+    if previous is not None:
+        beta[0], beta[1] = previous.intercept, previous.home_advantage
+        for team, i in index.items():
+            j = previous.index.get(team)
+            if j is not None:
+                beta[2 + i], beta[2 + n + i] = previous.attack[j], previous.defence[j]
+    else:
+        beta[0] = math.log(max(y.mean(), 1e-3))
+
+    # Ridge on team parameters only; also pins down the otherwise free offsets
+    penalty = np.full(2 + 2 * n, ridge)
+    penalty[:2] = 0
+
+    def objective(b):
+        eta = X @ b
+        return float(y @ eta - np.exp(eta).sum() - 0.5 * (penalty * b * b).sum())
+
+    current = objective(beta)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        mu = np.exp(X @ beta)
+        gradient = X.T @ (y - mu) - penalty * beta
+        hessian = (X.T * mu) @ X + np.diag(penalty)
+        step = np.linalg.solve(hessian, gradient)
+
+        # Step halving keeps a poor warm start from overshooting
+        scale = 1.0
+        while scale > 1e-4:
+            candidate = beta + scale * step
+            value = objective(candidate)
+            if value >= current - 1e-12:
+                break
+            scale /= 2
+        beta, current = candidate, value
+        if np.abs(scale * step).max() < tol:
+            break
+
+    eta = X @ beta
+    home_rate, away_rate = np.exp(eta[0::2]), np.exp(eta[1::2])
+    rho = _fit_rho(matches, home_rate, away_rate, start=previous.rho if previous is not None else 0.0)
+
+    return GoalModel(teams, beta[2:2 + n], beta[2 + n:], beta[0], beta[1], rho,
+                     matches=len(matches), fingerprint=results_fingerprint(matches),
+                     iterations=iterations)
+
+
+def has_schedule_table(html):
+    """Whether the page contains FBref's scores and fixtures table."""
+    return bool(html) and _SCHEDULE_TABLE_RE.search(html) is not None
+
+
+def fetch_schedule(url=None):
+    """Download the season's fixtures; returns (played matches, remaining fixtures)."""
+    from extract import extract_table
+    from fetcher import fetcher
+
+    # Revalidated like the stats pages, so an unchanged schedule is a 304
+    result = fetcher.fetch(url or FIXTURES_URL, expect=has_schedule_table)
+    df = extract_table(result.html, match="Score")
+    return parse_results(df), parse_remaining(df)
+
+
+def fetch_results(url=None):
+    """Download and parse the season's played matches."""
+    return fetch_schedule(url)[0]
+
+
+def updated_meta(meta, matches, remaining=None):
+    """Snapshot ``meta`` with the goal model (and season) brought up to date with ``matches``.
+
+    Starts from the parameters already in ``meta``; unchanged results are
+    not refitted.
+    """
+    previous = GoalModel.from_meta(meta.get("goal_model"))
+    if previous is not None and previous.fingerprint == results_fingerprint(matches):
+        model = previous
+    else:
+        model = fit_goal_model(matches, previous=previous)
+
+    meta = dict(meta, goal_model=model.to_meta())
+    if remaining is not None:
+        meta["season"] = season_meta(matches, remaining)
+    return meta
+
+
+def refit_snapshot(matches, path=None, remaining=None):
+    """Refit from the snapshot's stored parameters and write them back.
+
+    With ``remaining`` fixtures the season (results and fixtures left) is
+    stored too, for the simulator. Returns the model, or None when the
+    snapshot is already up to date.
+    """
+    from snapshot import default_snapshot_path, open_snapshot, publish_snapshot
+
+    path = path or default_snapshot_path()
+    snapshot = open_snapshot(path, max_age=None)
+    if snapshot is None:
+        raise ValueError(f"No stats snapshot at {path}")
+
+    meta = updated_meta(snapshot.meta, matches, remaining)
+    if meta == snapshot.meta:
+        return None
+
+    columns = {name: snapshot.column(name) for name in snapshot.columns}
+    arrays = {name: snapshot.array(name) for name in snapshot.arrays}
+    publish_snapshot(snapshot.squads, columns, meta=meta, path=path, created_at=snapshot.created_at,
+                     arrays=arrays)
+    return GoalModel.from_meta(meta["goal_model"])
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Refit the goal model stored in the stats snapshot.")
+    parser.add_argument("--url", default=FIXTURES_URL, help="FBref scores & fixtures page")
+    parser.add_argument("--snapshot", default=None, help="snapshot path (default: PL_SNAPSHOT_PATH)")
+    args = parser.parse_args(argv)
+
+    try:
+        matches, remaining = fetch_schedule(args.url)
+        started = time.perf_counter()
+        model = refit_snapshot(matches, args.snapshot, remaining=remaining)
+    except Exception as e:
+        print(f"Goal model refit failed: {e}")
+        return 1
+
+    if model is None:
+        print(f"Goal model already up to date with these {len(matches)} results")
+    else:
+        print(f"Stored goal model for {model.matches} matches ({model.iterations} fit iterations, "
+              f"{len(remaining)} fixtures left, {(time.perf_counter() - started) * 1000:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
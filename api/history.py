@@ -0,0 +1,212 @@
+"""Historical team stats: every published snapshot, kept in SQLite.
+
+Each refresh appends the snapshot's numeric columns keyed by
+(competition, season, date, squad), one row per metric. A later refresh
+on the same day replaces that day's rows. Indexes serve the two usual
+questions without scanning the whole history:
+
+* a squad's metric over its last N snapshots (form, backtesting), read
+  straight from the ``(competition, squad, metric, date)`` covering index;
+* every stat as of a date: the newest snapshot date on or before it (the
+  ``(competition, date)`` index), then that day's rows by primary key.
+
+Standard library only.
+
+    python api/history.py Arsenal PrgP --last 6
+    python api/history.py --as-of 2025-01-01 Arsenal
+    python api/history.py --record            # store the current snapshot
+"""
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from cache import default_cache_dir
+
+COMPETITION = os.environ.get("PL_COMPETITION", "premier-league")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    competition TEXT NOT NULL,
+    season      TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    version     TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (competition, season, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshots_by_date ON snapshots (competition, date);
+
+CREATE TABLE IF NOT EXISTS squad_stats (
+    competition TEXT NOT NULL,
+    season      TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    squad       TEXT NOT NULL,
+    metric      TEXT NOT NULL,
+    value       REAL,
+    PRIMARY KEY (competition, season, date, squad, metric)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS squad_stats_by_squad
+    ON squad_stats (competition, squad, metric, date, value);
+"""
+
+
+def default_history_path():
+    return os.environ.get("PL_HISTORY_PATH") or os.path.join(default_cache_dir(), "history.sqlite3")
+
+
+def snapshot_date(created_at):
+    """UTC calendar date (YYYY-MM-DD) of a snapshot timestamp."""
+    return time.strftime("%Y-%m-%d", time.gmtime(created_at))
+
+
+def season_of(date):
+    """Season label for a date: ``2024-2025`` from July 2024 to June 2025."""
+    year, month = int(date[:4]), int(date[5:7])
+    start = year if month >= 7 else year - 1
+    return f"{start}-{start + 1}"
+
+
+class HistoryStore:
+    """Append-only store of snapshots; safe to share between threads."""
+
+    def __init__(self, path=None):
+        self.path = path or default_history_path()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        # Readers (queries, other processes) never block the refresher's appends
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def record(self, squads, columns, version, created_at, competition=COMPETITION, season=None):
+        """Store one snapshot's ``{metric: values}`` (in ``squads`` order).
+
+        Returns the (season, date) it was stored under.
+        """
+        date = snapshot_date(created_at)
+        season = season or season_of(date)
+        rows = []
+        for metric, values in columns.items():
+            for squad, value in zip(squads, values):
+                value = float(value)
+                rows.append((competition, season, date, squad, metric,
+                             None if math.isnan(value) else value))
+
+        with self._lock, self._db:
+            key = (competition, season, date)
+            self._db.execute("DELETE FROM squad_stats WHERE competition = ? AND season = ? AND date = ?", key)
+            self._db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                             key + (str(version), created_at))
+            self._db.executemany("INSERT OR REPLACE INTO squad_stats VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return season, date
+
+    def record_snapshot(self, snapshot, competition=COMPETITION, season=None):
+        """Store a ``snapshot.Snapshot``."""
+        columns = {name: snapshot.column(name) for name in snapshot.columns}
+        return self.record(snapshot.squads, columns, snapshot.version, snapshot.created_at,
+                           competition=competition, season=season)
+
+    def series(self, squad, metric, last=6, competition=COMPETITION, before=None):
+        """``[(date, value), ...]`` of the squad's last ``last`` snapshots, oldest first.
+
+        ``before`` (YYYY-MM-DD, inclusive) looks back from that date instead
+        of from the latest snapshot, as a backtest would.
+        """
+        query = ("SELECT date, value FROM squad_stats "
+                 "WHERE competition = ? AND squad = ? AND metric = ?")
+        params = [competition, squad, metric]
+        if before is not None:
+            query += " AND date <= ?"
+            params.append(before)
+        query += " ORDER BY date DESC LIMIT ?"
+        params.append(last)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return rows[::-1]
+
+    def as_of(self, date, competition=COMPETITION, squads=None):
+        """Stats of the newest snapshot on or before ``date``.
+
+        Returns ``{"season", "date", "version", "stats": {squad: {metric: value}}}``
+        (optionally only for ``squads``), or None when there is none. Missing
+        values are None, so the result is valid JSON as it is.
+        """
+        with self._lock:
+            found = self._db.execute(
+                "SELECT season, date, version FROM snapshots "
+                "WHERE competition = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+                (competition, date)).fetchone()
+            if found is None:
+                return None
+            season, day, version = found
+            query = ("SELECT squad, metric, value FROM squad_stats "
+                     "WHERE competition = ? AND season = ? AND date = ?")
+            params = [competition, season, day]
+            if squads:
+                query += f" AND squad IN ({', '.join('?' * len(squads))})"
+                params += list(squads)
+            rows = self._db.execute(query, params).fetchall()
+
+        stats = {}
+        for squad, metric, value in rows:
+            stats.setdefault(squad, {})[metric] = value
+        return {"season": season, "date": day, "version": version, "stats": stats}
+
+    def snapshots(self, competition=COMPETITION):
+        """``[(season, date, version), ...]`` of every stored snapshot, oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT season, date, version FROM snapshots WHERE competition = ? ORDER BY date",
+                (competition,)).fetchall()
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Query (or add to) the team stats history.")
+    parser.add_argument("squad", nargs="?", help="squad name, e.g. Arsenal")
+    parser.add_argument("metric", nargs="?", help="stats column, e.g. PrgP")
+    parser.add_argument("--last", type=int, default=6, help="how many snapshots (default 6)")
+    parser.add_argument("--as-of", default=None, help="stats as of this date (YYYY-MM-DD)")
+    parser.add_argument("--record", action="store_true", help="store the current snapshot")
+    parser.add_argument("--history", default=None, help="history database (default: PL_HISTORY_PATH)")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.history)
+    if args.record:
+        from snapshot import open_snapshot
+
+        snapshot = open_snapshot(max_age=None)
+        if snapshot is None:
+            print("No stats snapshot to record; run python api/refresh.py")
+            return 1
+        season, date = store.record_snapshot(snapshot)
+        print(f"Recorded snapshot {snapshot.version} as {season} {date}")
+    elif args.as_of:
+        result = store.as_of(args.as_of, squads=[args.squad] if args.squad else None)
+        if result is None:
+            print(f"No snapshot on or before {args.as_of}")
+            return 1
+        print(json.dumps(result, indent=2, allow_nan=False))
+    elif args.squad and args.metric:
+        for date, value in store.series(args.squad, args.metric, last=args.last):
+            print(f"{date}  {value}")
+    else:
+        for season, date, version in store.snapshots():
+            print(f"{season}  {date}  {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
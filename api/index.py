@@ -2,81 +2,105 @@ from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
+from urllib.parse import parse_qs, urlparse
 
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from predictor import PremierLeaguePredictor
+import telemetry
+from metrics import FBREF_METRICS, metric_set, mock_prediction
+from resolver import FALLBACK_TEAMS
+from responses import cache_control, etag_matches, make_etag, parse_fields, send_json, send_not_modified
+
+
+def get_predictor():
+    """Create a predictor, importing it (pandas, numpy, ...) only for routes that need it."""
+    from predictor import PremierLeaguePredictor
+    return PremierLeaguePredictor()
+
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # In Vercel, the path is relative to the function file
         if self.path == '/' or self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {"status": "healthy", "message": "Premier League Predictor API"}
-            self.wfile.write(json.dumps(response).encode())
+            with telemetry.request("health"):
+                response = {"status": "healthy", "message": "Premier League Predictor API"}
+                send_json(self, response)
             
         elif self.path == '/teams':
-            self.handle_teams()
+            with telemetry.request("teams"):
+                self.handle_teams()
+            
+        elif self.path == '/metrics':
+            # Latencies, cache hit rates, fallbacks and upstream errors of this instance
+            send_json(self, telemetry.report())
+            
+        elif self.path == '/predict/batch':
+            # Batches are POST only; don't read "batch" as a prediction type
+            self.send_method_not_allowed('POST, OPTIONS')
             
         elif self.path.startswith('/predict/'):
-            self.handle_prediction_get()
+            with telemetry.request("predict:GET"):
+                self.handle_prediction_get()
             
         else:
-            self.send_response(404)
-            self.end_headers()
-            self.wfile.write(b'Not Found')
+            self.send_not_found()
 
     def do_POST(self):
         # Handle POST requests - in Vercel, path might be just '/' for the function
         if self.path == '/' or self.path == '/predict':
-            self.handle_prediction_post()
+            with telemetry.request("predict:POST"):
+                self.handle_prediction_post()
+        elif self.path == '/predict/batch':
+            with telemetry.request("predict:batch"):
+                self.handle_batch_post()
         else:
+            self.send_not_found()
+
+    def send_not_found(self):
+        with telemetry.request("not_found") as timings:
+            timings.status = 404
             self.send_response(404)
+            self.send_header('Content-Length', '9')
             self.end_headers()
             self.wfile.write(b'Not Found')
 
+    def send_method_not_allowed(self, allowed):
+        with telemetry.request("method_not_allowed") as timings:
+            timings.status = 405
+            body = b'Method Not Allowed'
+            self.send_response(405)
+            self.send_header('Allow', allowed)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def handle_teams(self):
         try:
-            predictor = PremierLeaguePredictor()
+            predictor = get_predictor()
             result = predictor.get_available_teams()
             
-            # If scraping failed, use fallback teams
+            # If the stats couldn't be read, use fallback teams
             if not result.get('success', False):
-                raise Exception("Scraping failed, using fallback")
+                raise Exception("No stats available, using fallback")
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            # Without published stats this is the fallback list; only cache it briefly
+            cache = cache_control(s_maxage=60) if result.get('fallback') else cache_control()
+            send_json(self, result, etag=make_etag("teams", *result['teams']), cache=cache)
             
         except Exception as e:
             # Fallback teams list
-            fallback_teams = [
-                'Arsenal', 'Aston Villa', 'Brighton', 'Burnley', 'Chelsea', 
-                'Crystal Palace', 'Everton', 'Fulham', 'Liverpool', 'Luton Town',
-                'Manchester City', 'Manchester Utd', 'Newcastle Utd', 'Nottingham Forest',
-                'Sheffield Utd', 'Tottenham', 'West Ham', 'Wolves', 'Bournemouth', 'Brentford'
-            ]
-            
-            result = {"success": True, "teams": fallback_teams}
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            telemetry.fallback("teams")
+            result = {"success": True, "teams": FALLBACK_TEAMS}
+            send_json(self, result, etag=make_etag("teams", *FALLBACK_TEAMS), cache=cache_control(s_maxage=60))
 
     def handle_prediction_post(self):
         try:
@@ -87,6 +111,7 @@ class handler(BaseHTTPRequestHandler):
             team1 = data.get('team1')
             team2 = data.get('team2')
             prediction_type = data.get('prediction_type', 'basic')
+            fields = parse_fields(data.get('fields'))
             
             if not team1 or not team2:
                 raise ValueError("Both teams must be specified")
@@ -95,13 +120,9 @@ class handler(BaseHTTPRequestHandler):
                 raise ValueError("Teams must be different")
             
             # Create mock prediction since web scraping doesn't work in Vercel
+            telemetry.fallback("mock_prediction")
             result = self.create_mock_prediction(team1, team2, prediction_type)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            send_json(self, result, fields=fields)
             
         except Exception as e:
             error_result = {
@@ -110,17 +131,34 @@ class handler(BaseHTTPRequestHandler):
                 "teams": [team1 if 'team1' in locals() else "", team2 if 'team2' in locals() else ""],
                 "prediction_type": prediction_type if 'prediction_type' in locals() else "basic"
             }
+            # Missing or identical teams are the client's fault, as in predict.py
+            send_json(self, error_result, status=400 if isinstance(e, ValueError) else 500)
+
+    def handle_batch_post(self):
+        try:
+            content_length = int(self.headers['Content-Length'])
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            prediction_type = data.get('prediction_type', 'basic')
+            fields = parse_fields(data.get('fields'))
             
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(error_result).encode())
+            predictor = get_predictor()
+            result = predictor.batch_prediction(data.get('fixtures'), prediction_type)
+            send_json(self, result, status=200 if result.get('success') else 400, fields=fields)
+            
+        except Exception as e:
+            error_result = {
+                "success": False,
+                "error": str(e)
+            }
+            send_json(self, error_result, status=500)
 
     def handle_prediction_get(self):
         try:
-            # Parse URL like /api/predict/basic/team1/team2 or /api/predict/advanced/team1/team2
-            path_parts = self.path.split('/')
+            # Parse URL like /api/predict/basic/team1/team2 or /api/predict/advanced/team1/team2,
+            # optionally followed by ?fields=...
+            url = urlparse(self.path)
+            path_parts = url.path.split('/')
+            fields = parse_fields(parse_qs(url.query).get('fields', [None])[0])
             if len(path_parts) < 6:
                 raise ValueError("Invalid URL format")
             
@@ -128,117 +166,38 @@ class handler(BaseHTTPRequestHandler):
             team1 = path_parts[4].replace('%20', ' ')
             team2 = path_parts[5].replace('%20', ' ')
             
-            predictor = PremierLeaguePredictor()
+            predictor = get_predictor()
+            
+            # Revalidation only needs the version of the two teams' stats, not a prediction
+            version = predictor.data_version(prediction_type, [team1, team2])
+            if version is not None:
+                etag = make_etag(version, prediction_type, team1, team2)
+                if etag_matches(self.headers, etag):
+                    send_not_modified(self, etag)
+                    return
             
             if prediction_type == 'basic':
                 result = predictor.basic_prediction([team1, team2])
             else:
                 result = predictor.advanced_prediction([team1, team2])
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            if result.get('success'):
+                version = predictor.data_version(prediction_type, [team1, team2])
+                etag = make_etag(version, prediction_type, team1, team2) if version else None
+                send_json(self, result, etag=etag, cache=cache_control(), fields=fields)
+            else:
+                send_json(self, result)
             
         except Exception as e:
             error_result = {
                 "success": False,
                 "error": str(e)
             }
-            
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(error_result).encode())
+            send_json(self, error_result, status=500)
 
     def create_mock_prediction(self, team1, team2, prediction_type):
         """Create a mock prediction result since web scraping doesn't work in Vercel."""
-        import random
-        
-        # Generate mock scores
-        team1_score = round(random.uniform(0.5, 3.0), 1)
-        team2_score = round(random.uniform(0.5, 3.0), 1)
-        
-        # Determine winner
-        if team1_score > team2_score:
-            predicted_winner = team1
-        elif team2_score > team1_score:
-            predicted_winner = team2
-        else:
-            predicted_winner = "Draw"
-        
-        # Create mock comparisons
-        if prediction_type == 'basic':
-            comparisons = [
-                {
-                    "metric": "Passing Accuracy",
-                    "team1_value": round(random.uniform(70, 90), 1),
-                    "team2_value": round(random.uniform(70, 90), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Progressive Passes",
-                    "team1_value": round(random.uniform(50, 120), 1),
-                    "team2_value": round(random.uniform(50, 120), 1),
-                    "winner": random.choice([team1, team2])
-                }
-            ]
-        else:  # advanced
-            comparisons = [
-                {
-                    "metric": "Passing Accuracy",
-                    "team1_value": round(random.uniform(70, 90), 1),
-                    "team2_value": round(random.uniform(70, 90), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Progressive Passes",
-                    "team1_value": round(random.uniform(50, 120), 1),
-                    "team2_value": round(random.uniform(50, 120), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Tackles Won",
-                    "team1_value": round(random.uniform(10, 25), 1),
-                    "team2_value": round(random.uniform(10, 25), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Saves",
-                    "team1_value": round(random.uniform(2, 8), 1),
-                    "team2_value": round(random.uniform(2, 8), 1),
-                    "winner": random.choice([team1, team2])
-                }
-            ]
-        
-        # Mock stats summary
-        stats_summary = [
-            {
-                "Squad": team1,
-                "Passing_Acc": round(random.uniform(75, 90), 1),
-                "Progressive_Passes": round(random.uniform(60, 100), 0),
-                "Tackles_Won": round(random.uniform(12, 20), 1),
-                "Saves": round(random.uniform(3, 7), 1)
-            },
-            {
-                "Squad": team2,
-                "Passing_Acc": round(random.uniform(75, 90), 1),
-                "Progressive_Passes": round(random.uniform(60, 100), 0),
-                "Tackles_Won": round(random.uniform(12, 20), 1),
-                "Saves": round(random.uniform(3, 7), 1)
-            }
-        ]
-        
-        return {
-            "success": True,
-            "prediction_type": prediction_type,
-            "teams": [team1, team2],
-            "predicted_winner": predicted_winner,
-            "team1_score": team1_score,
-            "team2_score": team2_score,
-            "comparisons": comparisons,
-            "stats_summary": stats_summary,
-            "disclaimer": "This is a mock prediction for demonstration purposes. Real predictions would use actual Premier League statistics from FBref.com."
-        }
\ No newline at end of file
+        return mock_prediction(
+            team1, team2, prediction_type, metric_set(FBREF_METRICS, prediction_type),
+            "This is a mock prediction for demonstration purposes. Real predictions would use actual Premier League statistics from FBref.com."
+        )
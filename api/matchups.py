@@ -0,0 +1,306 @@
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+
+
+class MatchupMatrix:
+    """All-pairs metric comparisons for one data snapshot.
+
+    ``values`` is a (teams x metrics) array. On construction the full
+    team x team x metric comparison tensor and the per-pair metric-win
+    counts are computed in a few vectorized operations, so predicting any
+    fixture afterwards is just indexing.
+
+    ``directions`` and ``weights`` map metrics to +1/-1 (higher/lower is
+    better) and to their weight in the team scores; both default to 1.
+
+    Missing (NaN) values never win a metric. With ``skip_missing`` they are
+    left out of the comparisons entirely, otherwise they count as a draw.
+    """
+
+    def __init__(self, squads, values, metrics, skip_missing=False, directions=None, weights=None):
+        self.squads = list(squads)
+        self.metrics = list(metrics)
+        self.values = np.asarray(values, dtype=float).reshape(len(self.squads), len(self.metrics))
+        self.skip_missing = skip_missing
+        self.directions = np.array([(directions or {}).get(m, 1) for m in self.metrics], dtype=np.int8)
+        self.weights = np.array([(weights or {}).get(m, 1) for m in self.metrics], dtype=float)
+
+        self.index = {}
+        for i, squad in enumerate(self.squads):
+            # First row wins, like the old .iloc[0] lookups
+            self.index.setdefault(squad, i)
+
+        # valid[i, j, k]: both teams have a value for metric k
+        # comparison[i, j, k] = +1 if team i beats team j on metric k, -1 if it loses
+        self.valid, self.comparison = self._compare(self.values)
+
+        # Weighted metric wins per pair; stay integers while every weight is whole
+        weights = self._score_weights()
+        self.team1_scores = (self.comparison > 0) @ weights
+        self.team2_scores = (self.comparison < 0) @ weights
+        # +1 row team wins, -1 column team wins, 0 draw
+        self.winners = np.sign(self.team1_scores - self.team2_scores).astype(np.int8)
+
+    def _compare(self, rows):
+        """(valid, comparison) of the teams in ``rows`` (a values slice) against every team."""
+        a = rows[:, None, :]
+        b = self.values[None, :, :]
+        valid = ~(np.isnan(a) | np.isnan(b))
+        with np.errstate(invalid="ignore"):
+            comparison = np.where(valid, np.sign(a - b), 0).astype(np.int8) * self.directions
+        return valid, comparison
+
+    def _score_weights(self):
+        return self.weights.astype(np.int64) if (self.weights % 1 == 0).all() else self.weights
+
+    def updated(self, values, rows):
+        """A copy for new ``values`` (same squads and metrics) that differ only in ``rows``.
+
+        Only the pairs involving those rows are compared again, so the cost
+        grows with the number of changed teams rather than teams squared.
+        """
+        matrix = self.__class__.__new__(self.__class__)
+        matrix.__dict__.update(self.__dict__)
+        matrix.values = np.asarray(values, dtype=float).reshape(self.values.shape)
+        for name in self.ARRAYS[1:]:
+            setattr(matrix, name, np.array(getattr(self, name)))
+        rows = np.array(sorted(set(rows)), dtype=np.intp)
+        if not rows.size:
+            return matrix
+
+        valid, comparison = matrix._compare(matrix.values[rows])
+        matrix.valid[rows] = valid
+        matrix.comparison[rows] = comparison
+        # Comparisons are antisymmetric, so the changed columns are the rows mirrored
+        matrix.valid[:, rows] = valid.transpose(1, 0, 2)
+        matrix.comparison[:, rows] = -comparison.transpose(1, 0, 2)
+
+        weights = matrix._score_weights()
+        for index in (rows, (slice(None), rows)):
+            matrix.team1_scores[index] = (matrix.comparison[index] > 0) @ weights
+            matrix.team2_scores[index] = (matrix.comparison[index] < 0) @ weights
+            matrix.winners[index] = np.sign(matrix.team1_scores[index] - matrix.team2_scores[index])
+        return matrix
+
+    # Everything computed on construction, as stored by ``arrays``
+    ARRAYS = ("values", "valid", "comparison", "team1_scores", "team2_scores", "winners")
+
+    @classmethod
+    def from_arrays(cls, squads, metrics, arrays, skip_missing=False, directions=None, weights=None):
+        """Wrap already computed ``arrays`` (see ``arrays()``) without copying them."""
+        matrix = cls.__new__(cls)
+        matrix.squads = list(squads)
+        matrix.metrics = list(metrics)
+        matrix.skip_missing = skip_missing
+        matrix.directions = np.array([(directions or {}).get(m, 1) for m in matrix.metrics], dtype=np.int8)
+        matrix.weights = np.array([(weights or {}).get(m, 1) for m in matrix.metrics], dtype=float)
+        matrix.index = {}
+        for i, squad in enumerate(matrix.squads):
+            matrix.index.setdefault(squad, i)
+        for name in cls.ARRAYS:
+            setattr(matrix, name, np.asarray(arrays[name]))
+        if matrix.values.shape != (len(matrix.squads), len(matrix.metrics)):
+            raise ValueError("Precomputed arrays do not match the squads and metrics")
+        return matrix
+
+    def arrays(self):
+        """The computed arrays by name, for storing with the data they came from."""
+        return {name: np.ascontiguousarray(getattr(self, name)) for name in self.ARRAYS}
+
+    @classmethod
+    def from_frame(cls, df, metrics, fill_value=None, skip_missing=False, directions=None, weights=None):
+        """Build from a DataFrame with a ``Squad`` column; absent metrics are dropped."""
+        import pandas as pd
+
+        metrics = [m for m in metrics if m in df.columns]
+        columns = {m: pd.to_numeric(df[m], errors="coerce").to_numpy(dtype=float) for m in metrics}
+        return cls.from_columns(df["Squad"].astype(str).tolist(), columns,
+                                fill_value=fill_value, skip_missing=skip_missing,
+                                directions=directions, weights=weights)
+
+    @classmethod
+    def from_columns(cls, squads, columns, fill_value=None, skip_missing=False, directions=None,
+                     weights=None):
+        """Build from a Squad list and a {metric: numeric sequence} mapping."""
+        return cls(squads, column_values(squads, columns, fill_value), list(columns),
+                   skip_missing=skip_missing, directions=directions, weights=weights)
+
+    def __contains__(self, squad):
+        return squad in self.index
+
+    def value(self, squad, metric):
+        return float(self.values[self.index[squad], self.metrics.index(metric)])
+
+    def lookup(self, squad1, squad2):
+        """Precomputed result for a fixture, or None if either squad is unknown.
+
+        Returns ``(team1_score, team2_score, winner, comparisons)`` where
+        winner is 1/-1/0 and comparisons is a list of
+        ``(metric, team1_value, team2_value, outcome)`` tuples.
+        """
+        return self.lookup_many([(squad1, squad2)])[0]
+
+    def lookup_many(self, pairs):
+        """Vectorized ``lookup`` over a list of (squad1, squad2) fixtures."""
+        rows = [(self.index.get(a), self.index.get(b)) for a, b in pairs]
+        known = [n for n, (i, j) in enumerate(rows) if i is not None and j is not None]
+        results = [None] * len(rows)
+        if not known:
+            return results
+
+        i = np.array([rows[n][0] for n in known], dtype=np.intp)
+        j = np.array([rows[n][1] for n in known], dtype=np.intp)
+        # One fancy-index per array for the whole batch
+        team1_scores = self.team1_scores[i, j].tolist()
+        team2_scores = self.team2_scores[i, j].tolist()
+        winners = self.winners[i, j].tolist()
+        outcomes = self.comparison[i, j].tolist()
+        valid = self.valid[i, j].tolist()
+        values1 = self.values[i].tolist()
+        values2 = self.values[j].tolist()
+
+        for n, row in enumerate(known):
+            comparisons = [
+                (metric, values1[n][k], values2[n][k], outcomes[n][k])
+                for k, metric in enumerate(self.metrics)
+                if valid[n][k] or not self.skip_missing
+            ]
+            results[row] = (team1_scores[n], team2_scores[n], winners[n], comparisons)
+        return results
+
+
+def column_values(squads, columns, fill_value=None):
+    """(teams x metrics) float array of ``{metric: values}``, NaNs replaced by ``fill_value``."""
+    if columns:
+        values = np.column_stack([np.asarray(values, dtype=float) for values in columns.values()])
+    else:
+        values = np.empty((len(squads), 0))
+    if fill_value is not None:
+        values = np.where(np.isnan(values), fill_value, values)
+    return values
+
+
+MAX_BATCH_FIXTURES = 50
+
+
+def parse_fixture(fixture):
+    """Return (team1, team2) from a ``{"team1", "team2"}`` dict or a two-item list."""
+    if isinstance(fixture, dict):
+        team1, team2 = fixture.get('team1'), fixture.get('team2')
+    elif isinstance(fixture, (list, tuple)) and len(fixture) == 2:
+        team1, team2 = fixture
+    else:
+        raise ValueError("Each fixture must be {\"team1\": ..., \"team2\": ...} or [team1, team2]")
+
+    if not team1 or not team2:
+        raise ValueError("Both teams must be specified")
+    if team1 == team2:
+        raise ValueError("Teams must be different")
+    return team1, team2
+
+
+def parse_fixtures(fixtures):
+    """Validate a batch; returns a list of (team1, team2) tuples or ValueErrors."""
+    if not isinstance(fixtures, list) or not fixtures:
+        raise ValueError("fixtures must be a non-empty list")
+    if len(fixtures) > MAX_BATCH_FIXTURES:
+        raise ValueError(f"At most {MAX_BATCH_FIXTURES} fixtures per batch")
+
+    parsed = []
+    for fixture in fixtures:
+        try:
+            parsed.append(parse_fixture(fixture))
+        except ValueError as e:
+            parsed.append(e)
+    return parsed
+
+
+_matrices = OrderedDict()
+_matrices_lock = threading.Lock()
+MAX_CACHED_MATRICES = 8
+
+
+def cached_matrix(name, sources, build):
+    """Build a matrix once per snapshot of ``sources`` (the tables it is derived from).
+
+    Snapshots are identified by object identity; the sources are kept alive
+    alongside the matrix so their ids cannot be reused while cached.
+    """
+    key = (name,) + tuple(id(source) for source in sources)
+    with _matrices_lock:
+        hit = _matrices.get(key)
+        if hit is not None:
+            _matrices.move_to_end(key)
+            telemetry.count("cache", "matrix:hit")
+            return hit[1]
+
+    telemetry.count("cache", "matrix:miss")
+    with telemetry.stage(f"build_{name.split(':')[0]}"):
+        matrix = build()
+    with _matrices_lock:
+        _matrices[key] = (tuple(sources), matrix)
+        while len(_matrices) > MAX_CACHED_MATRICES:
+            _matrices.popitem(last=False)
+    return matrix
+
+
+def _snapshot_key(metrics, fill_value, skip_missing):
+    """Array name prefix of a metric set's matrix, built with these options.
+
+    The set's columns, directions and weights are part of it, so editing
+    the registry never attaches arrays computed for the old definition.
+    """
+    recipe = repr((metrics.columns, sorted(metrics.directions.items()),
+                   sorted(metrics.weights.items()), fill_value, skip_missing))
+    return f"matrix:{metrics.name}:{zlib.crc32(recipe.encode('utf-8')):08x}"
+
+
+def precompute_arrays(squads, columns, metrics, fill_value=None, skip_missing=False,
+                      previous=None, changed=None):
+    """``{name: array}`` of the metric set's matrix, for ``publish_snapshot(arrays=...)``.
+
+    Given the ``previous`` snapshot and the squads that ``changed`` since
+    it (see ``snapshot.changed_squads``), its matrix is updated in place of
+    a full rebuild: only pairs involving changed squads are compared again.
+    """
+    key = _snapshot_key(metrics, fill_value, skip_missing)
+    present = {m: columns[m] for m in metrics.columns if m in columns}
+    names = [f"{key}:{name}" for name in MatchupMatrix.ARRAYS]
+    if previous is not None and changed is not None and all(name in previous.arrays for name in names):
+        matrix = snapshot_matrix(previous, metrics, fill_value=fill_value, skip_missing=skip_missing)
+        index = {squad: i for i, squad in enumerate(squads)}
+        matrix = matrix.updated(column_values(squads, present, fill_value),
+                                [index[squad] for squad in changed])
+    else:
+        matrix = MatchupMatrix.from_columns(squads, present, fill_value=fill_value,
+                                            skip_missing=skip_missing,
+                                            directions=metrics.directions, weights=metrics.weights)
+    return {f"{key}:{name}": array for name, array in matrix.arrays().items()}
+
+
+def snapshot_matrix(snapshot, metrics, fill_value=None, skip_missing=False):
+    """The metric set's matrix over a stats snapshot.
+
+    When the refresher stored it in the snapshot (``precompute_arrays``) the
+    matrix wraps the shared, memory-mapped arrays and nothing is computed;
+    otherwise it is built from the snapshot's columns.
+    """
+    key = _snapshot_key(metrics, fill_value, skip_missing)
+    present = [m for m in metrics.columns if m in snapshot]
+    names = [f"{key}:{name}" for name in MatchupMatrix.ARRAYS]
+    if all(name in snapshot.arrays for name in names):
+        arrays = {name: snapshot.array(f"{key}:{name}") for name in MatchupMatrix.ARRAYS}
+        return MatchupMatrix.from_arrays(snapshot.squads, present, arrays, skip_missing=skip_missing,
+                                         directions=metrics.directions, weights=metrics.weights)
+    return MatchupMatrix.from_columns(snapshot.squads, {m: snapshot.column(m) for m in present},
+                                      fill_value=fill_value, skip_missing=skip_missing,
+                                      directions=metrics.directions, weights=metrics.weights)
@@ -0,0 +1,152 @@
+"""Registry of the metrics predictions compare teams on.
+
+Each ``Metric`` names the stats table and column it comes from, whether
+higher or lower values are better, its weight in the overall score and
+the range mock predictions draw from. ``MatchupMatrix`` evaluates a whole
+set as array operations, so adding a metric is a one-line change here.
+
+Kept free of numpy/pandas so lightweight endpoints can import it.
+"""
+import random
+import zlib
+from typing import NamedTuple
+
+HIGHER_IS_BETTER = 1
+LOWER_IS_BETTER = -1
+
+
+class Metric(NamedTuple):
+    column: str
+    label: str
+    source: str = "passing"
+    direction: int = HIGHER_IS_BETTER
+    weight: float = 1
+    mock_range: tuple = (0, 100)
+
+
+class MetricSet:
+    """An ordered group of metrics compared by one prediction type.
+
+    ``summary`` lists the columns shown in ``stats_summary`` (default:
+    the metric columns), always preceded by ``Squad``.
+    """
+
+    def __init__(self, name, metrics, summary=None):
+        self.name = name
+        self.metrics = tuple(metrics)
+        self.columns = [metric.column for metric in self.metrics]
+        self.labels = {metric.column: metric.label for metric in self.metrics}
+        self.directions = {metric.column: metric.direction for metric in self.metrics}
+        self.weights = {metric.column: metric.weight for metric in self.metrics}
+        # Tables to load, in first-use order (the first one defines the squads)
+        self.sources = list(dict.fromkeys(metric.source for metric in self.metrics))
+        self.summary = ["Squad"] + list(summary if summary is not None else self.columns)
+
+    def subset(self, name, columns):
+        """A new set with only ``columns``, in registry order."""
+        return MetricSet(name, [metric for metric in self.metrics if metric.column in columns])
+
+    def __iter__(self):
+        return iter(self.metrics)
+
+    def __len__(self):
+        return len(self.metrics)
+
+
+# Raw FBref squad-table columns, as compared by the scraping predictor
+FBREF_METRICS = {
+    "basic": MetricSet("basic", [
+        Metric("Total_Cmp%", "Pass Completion %", "passing", mock_range=(70, 90)),
+        Metric("Ast", "Assists", "passing", mock_range=(10, 25)),
+    ], summary=["Total_Cmp", "Total_Att", "Total_Cmp%", "Ast"]),
+    # Balanced metrics for offense and defense
+    "advanced": MetricSet("advanced", [
+        Metric("Ast", "Assists (Goal Creation)", "passing", mock_range=(10, 25)),
+        Metric("PrgP", "Progressive Passes (Attacking Intent)", "passing", mock_range=(50, 120)),
+        Metric("Tackles_TklW", "Tackles Won (Ball Winning)", "defense", mock_range=(10, 25)),
+        Metric("Performance_Saves", "Goalkeeper Saves (Shot Stopping)", "keepers", mock_range=(2, 8)),
+    ]),
+}
+
+# FBref passing columns -> names used by the /api/predict endpoint
+PASSING_COLUMNS = {
+    "Total_Cmp%": "Passing_Accuracy",
+    "Total_Cmp": "Completed_Passes",
+    "Ast": "Assists",
+    "PrgP": "Progressive_Passes",
+}
+
+# Renamed passing-table columns used by the /api/predict endpoint
+_PASSING_ADVANCED = MetricSet("real-advanced", [
+    Metric("Passing_Accuracy", "Passing Accuracy (%)", mock_range=(70, 90)),
+    Metric("Progressive_Passes", "Progressive Passes", mock_range=(50, 120)),
+    Metric("Assists", "Assists", mock_range=(10, 25)),
+])
+PASSING_METRICS = {
+    "basic": _PASSING_ADVANCED.subset("real-basic", ["Passing_Accuracy", "Progressive_Passes"]),
+    "advanced": _PASSING_ADVANCED,
+}
+
+
+def metric_set(registry, prediction_type, default="basic"):
+    """The set registered for ``prediction_type``, or the ``default`` one."""
+    return registry.get(prediction_type) or registry[default]
+
+
+def stable_seed(*parts):
+    """A seed that is the same in every process (unlike ``hash`` of a str)."""
+    return zlib.crc32("|".join(str(part).lower() for part in parts).encode("utf-8"))
+
+
+def pick_winner(outcome, team1, team2):
+    """Map a +1/-1/0 outcome to the response's winner string."""
+    if outcome > 0:
+        return team1
+    if outcome < 0:
+        return team2
+    return "Draw"
+
+
+def mock_prediction(team1, team2, prediction_type, metrics, disclaimer, seed=None):
+    """A prediction response filled with plausible random values.
+
+    Values come from each metric's ``mock_range`` and winners follow the
+    metric's direction. Pass ``seed`` for repeatable output.
+    """
+    rng = random.Random(seed)
+
+    team1_score = round(rng.uniform(0.5, 3.0), 1)
+    team2_score = round(rng.uniform(0.5, 3.0), 1)
+    if team1_score > team2_score:
+        predicted_winner = team1
+    elif team2_score > team1_score:
+        predicted_winner = team2
+    else:
+        predicted_winner = "Draw"
+
+    comparisons = []
+    summary1, summary2 = {"Squad": team1}, {"Squad": team2}
+    for metric in metrics:
+        value1 = round(rng.uniform(*metric.mock_range), 1)
+        value2 = round(rng.uniform(*metric.mock_range), 1)
+        edge = (value1 > value2) - (value1 < value2)
+        comparisons.append({
+            "metric": metric.label,
+            "team1_value": value1,
+            "team2_value": value2,
+            "winner": pick_winner(edge * metric.direction, team1, team2)
+        })
+        summary1[metric.column] = value1
+        summary2[metric.column] = value2
+
+    return {
+        "success": True,
+        "prediction_type": prediction_type,
+        "teams": [team1, team2],
+        "predicted_winner": predicted_winner,
+        "team1_score": team1_score,
+        "team2_score": team2_score,
+        "comparisons": comparisons,
+        "stats_summary": [summary1, summary2],
+        "disclaimer": disclaimer
+    }
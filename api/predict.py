@@ -1,10 +1,18 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import random
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-from io import StringIO
+from urllib.parse import parse_qs, urlparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+from goal_model import GoalModel
+from matchups import cached_matrix, parse_fixtures, snapshot_matrix
+from metrics import PASSING_METRICS, metric_set, mock_prediction, pick_winner, stable_seed
+from resolver import resolver_for
+from responses import cache_control, etag_matches, make_etag, parse_fields, send_json, send_not_modified
+from snapshot import open_snapshot
 
 
 class handler(BaseHTTPRequestHandler):
@@ -13,33 +21,53 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_POST(self):
+        with telemetry.request("predict:POST"):
+            self.handle_post()
+
+    def do_GET(self):
+        with telemetry.request("predict:GET"):
+            self.handle_get()
+
+    def handle_post(self):
         try:
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data.decode('utf-8'))
             
-            team1 = data.get('team1')
-            team2 = data.get('team2')
             prediction_type = data.get('prediction_type', 'basic')
+            fields = parse_fields(data.get('fields'))
             
-            if not team1 or not team2:
-                raise ValueError("Both teams must be specified")
-            
-            if team1 == team2:
-                raise ValueError("Teams must be different")
-            
-            # Create prediction with real data (fallback to mock if needed)
-            result = self.create_prediction_with_real_data(team1, team2, prediction_type)
+            if 'fixtures' in data:
+                # Batch mode: a whole gameweek from one fetch of the stats table
+                result = self.create_batch_prediction(data['fixtures'], prediction_type)
+            else:
+                team1 = data.get('team1')
+                team2 = data.get('team2')
+                
+                if not team1 or not team2:
+                    raise ValueError("Both teams must be specified")
+                
+                if team1 == team2:
+                    raise ValueError("Teams must be different")
+                
+                # Create prediction with real data (fallback to mock if needed)
+                result = self.create_prediction_with_real_data(team1, team2, prediction_type)
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            send_json(self, result, fields=fields)
             
+        except ValueError as e:
+            # Bad request body (malformed fixtures, missing or duplicate teams), as index.py answers it
+            error_result = {
+                "success": False,
+                "error": str(e),
+                "teams": [team1 if 'team1' in locals() else "", team2 if 'team2' in locals() else ""],
+                "prediction_type": prediction_type if 'prediction_type' in locals() else "basic"
+            }
+            send_json(self, error_result, status=400)
         except Exception as e:
             error_result = {
                 "success": False,
@@ -47,200 +75,184 @@ class handler(BaseHTTPRequestHandler):
                 "teams": [team1 if 'team1' in locals() else "", team2 if 'team2' in locals() else ""],
                 "prediction_type": prediction_type if 'prediction_type' in locals() else "basic"
             }
-            
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(error_result).encode())
+            send_json(self, error_result, status=500)
 
-    def get_real_team_data(self):
-        """Scrape real Premier League team data from FBref."""
+    def handle_get(self):
+        """Cacheable single prediction: /api/predict?team1=...&team2=...&prediction_type=...&fields=..."""
         try:
-            # Use requests with headers to avoid being blocked
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            query = parse_qs(urlparse(self.path).query)
+            team1 = query.get('team1', [''])[0]
+            team2 = query.get('team2', [''])[0]
+            prediction_type = query.get('prediction_type', ['basic'])[0]
+            fields = parse_fields(query.get('fields', [None])[0])
             
-            url = "https://fbref.com/en/comps/9/passing/Premier-League-Stats"
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            # Parse with pandas
-            dfs = pd.read_html(StringIO(response.text), match="Squad")
-            if not dfs:
-                return None
-                
-            df = dfs[0]
-            
-            # Handle multi-level columns
-            if isinstance(df.columns, pd.MultiIndex):
-                # Flatten multi-index columns
-                df.columns = ['_'.join(col).strip() if isinstance(col, tuple) else col for col in df.columns]
-            
-            # Clean column names
-            rename_map = {}
-            for col in df.columns:
-                if 'Squad' in col and 'Unnamed' in col:
-                    rename_map[col] = 'Squad'
-                elif 'Cmp%' in col and 'Total' in col:
-                    rename_map[col] = 'Passing_Accuracy'
-                elif 'Ast' in col and 'Unnamed' in col:
-                    rename_map[col] = 'Assists'
-                elif 'PrgP' in col and 'Unnamed' in col:
-                    rename_map[col] = 'Progressive_Passes'
-                elif 'Cmp' in col and 'Total' in col:
-                    rename_map[col] = 'Completed_Passes'
+            if not team1 or not team2:
+                raise ValueError("Both teams must be specified")
             
-            df = df.rename(columns=rename_map)
+            if team1 == team2:
+                raise ValueError("Teams must be different")
             
-            # Convert numeric columns
-            numeric_cols = ['Passing_Accuracy', 'Assists', 'Progressive_Passes', 'Completed_Passes']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            # Revalidation needs only the data version and the resolved fixture
+            stats = self.get_team_stats()
+            etag = self.prediction_etag(stats, team1, team2, prediction_type)
+            # Mock answers (no data yet) are only cached briefly at the edge
+            cache = cache_control() if stats is not None else cache_control(s_maxage=60)
+            if etag_matches(self.headers, etag):
+                send_not_modified(self, etag, cache)
+                return
             
-            return df
+            result = self.create_prediction_with_real_data(team1, team2, prediction_type)
+            send_json(self, result, etag=etag, cache=cache, fields=fields)
             
         except Exception as e:
-            print(f"Error scraping data: {e}")
-            return None
+            error_result = {
+                "success": False,
+                "error": str(e),
+                "teams": [team1 if 'team1' in locals() else "", team2 if 'team2' in locals() else ""],
+                "prediction_type": prediction_type if 'prediction_type' in locals() else "basic"
+            }
+            send_json(self, error_result, status=500)
 
-    def find_team_match(self, team_name, df):
-        """Find team name in DataFrame with fuzzy matching."""
-        if df is None or 'Squad' not in df.columns:
-            return None
-            
-        team_name_lower = team_name.lower()
-        
-        # Try exact match first
-        exact_match = df[df['Squad'].str.lower() == team_name_lower]
-        if not exact_match.empty:
-            return exact_match.iloc[0]
-        
-        # Try partial match
-        partial_match = df[df['Squad'].str.lower().str.contains(team_name_lower, na=False)]
-        if not partial_match.empty:
-            return partial_match.iloc[0]
-        
-        # Common team name mappings
-        name_mappings = {
-            'man city': 'Manchester City',
-            'man utd': 'Manchester Utd',
-            'man united': 'Manchester Utd',
-            'tottenham': 'Tottenham',
-            'spurs': 'Tottenham',
-            'arsenal': 'Arsenal',
-            'chelsea': 'Chelsea',
-            'liverpool': 'Liverpool',
-            'brighton': 'Brighton',
-            'newcastle': 'Newcastle Utd',
-            'west ham': 'West Ham',
-            'aston villa': 'Aston Villa',
-            'crystal palace': 'Crystal Palace',
-            'fulham': 'Fulham',
-            'wolves': 'Wolves',
-            'everton': 'Everton',
-            'brentford': 'Brentford',
-            'nottingham forest': "Nott'ham Forest",
-            'forest': "Nott'ham Forest",
-            'luton': 'Luton Town',
-            'burnley': 'Burnley',
-            'sheffield united': 'Sheffield Utd',
-            'sheffield utd': 'Sheffield Utd'
-        }
-        
-        mapped_name = name_mappings.get(team_name_lower)
-        if mapped_name:
-            mapped_match = df[df['Squad'].str.lower() == mapped_name.lower()]
-            if not mapped_match.empty:
-                return mapped_match.iloc[0]
-        
-        return None
+    def prediction_etag(self, stats, team1, team2, prediction_type):
+        """ETag of a single prediction; aliases of the same fixture share it.
+
+        It depends only on the two squads' rows and the goal model, so a
+        refresh that changes other teams leaves it (and cached copies) valid.
+        """
+        if stats is None:
+            return make_etag('mock', prediction_type, team1, team2)
+        pair = [self.find_team_squad(team, stats.squads) or team for team in (team1, team2)]
+        if all(squad in stats.index for squad in pair):
+            version = stats.rows_version(pair, self.goal_model_version(stats))
+        else:
+            version = stats.version
+        return make_etag(version, prediction_type, *pair)
+
+    def goal_model_version(self, stats):
+        """Fingerprint of the snapshot's fitted goal model parameters."""
+        return cached_matrix('goal-model-version', [stats], lambda: make_etag(
+            json.dumps(stats.meta.get('goal_model'), sort_keys=True)))
+
+    def get_team_stats(self):
+        """The stats snapshot published by refresh.py, or None before the first refresh.
+
+        Requests never scrape: until a snapshot exists they get mock data.
+        """
+        return open_snapshot()
+
+    def find_team_squad(self, team_name, squads):
+        """Resolve a team name to one of ``squads`` (aliases and fuzzy matching included)."""
+        return resolver_for(squads).resolve(team_name)
 
     def create_prediction_with_real_data(self, team1, team2, prediction_type):
         """Create prediction using real data, fallback to mock if needed."""
         
         # Try to get real data
-        df = self.get_real_team_data()
+        stats = self.get_team_stats()
         
-        if df is not None:
-            team1_data = self.find_team_match(team1, df)
-            team2_data = self.find_team_match(team2, df)
+        if stats is not None:
+            with telemetry.stage("lookup"):
+                squad1 = self.find_team_squad(team1, stats.squads)
+                squad2 = self.find_team_squad(team2, stats.squads)
+                lookup = None
+                if squad1 is not None and squad2 is not None:
+                    lookup = self.get_matchup_matrix(stats, prediction_type).lookup(squad1, squad2)
             
-            if team1_data is not None and team2_data is not None:
-                return self.create_real_prediction(team1, team2, team1_data, team2_data, prediction_type)
+            if lookup is not None:
+                return self.build_real_prediction(team1, team2, (squad1, squad2), lookup, prediction_type, stats)
         
         # Fallback to mock data
         return self.create_mock_prediction(team1, team2, prediction_type)
 
-    def create_real_prediction(self, team1, team2, team1_data, team2_data, prediction_type):
-        """Create prediction using real team data."""
+    @staticmethod
+    def get_matchup_matrix(stats, prediction_type):
+        """All-pairs comparisons for this snapshot of the data, built once and then reused."""
+        metrics = metric_set(PASSING_METRICS, prediction_type)
+        return cached_matrix(metrics.name, [stats], lambda: snapshot_matrix(stats, metrics, fill_value=0))
+
+    def create_batch_prediction(self, fixtures, prediction_type):
+        """Predict a list of fixtures from one fetch of the stats table.
+
+        Matched fixtures are evaluated together with one matrix lookup;
+        unmatched teams fall back to mock data and invalid fixtures are
+        reported in place.
+        """
+        parsed = parse_fixtures(fixtures)
+        stats = self.get_team_stats()
+        squads = stats.squads if stats is not None else []
         
-        comparisons = []
-        team1_score = 0
-        team2_score = 0
+        squad_pairs = []
+        for teams in parsed:
+            pair = None
+            if squads and not isinstance(teams, ValueError):
+                squad1 = self.find_team_squad(teams[0], squads)
+                squad2 = self.find_team_squad(teams[1], squads)
+                if squad1 is not None and squad2 is not None:
+                    pair = (squad1, squad2)
+            squad_pairs.append(pair)
         
-        # Basic prediction metrics
-        basic_metrics = {
-            'Passing_Accuracy': 'Passing Accuracy (%)',
-            'Progressive_Passes': 'Progressive Passes',
-            'Assists': 'Assists'
-        }
+        matched = [pair for pair in squad_pairs if pair is not None]
+        lookups = iter(self.get_matchup_matrix(stats, prediction_type).lookup_many(matched) if matched else [])
         
-        # Advanced prediction includes more metrics
-        if prediction_type == 'advanced':
-            metrics_to_use = basic_metrics
-        else:
-            metrics_to_use = {k: v for k, v in basic_metrics.items() if k in ['Passing_Accuracy', 'Progressive_Passes']}
+        results = []
+        for fixture, teams, pair in zip(fixtures, parsed, squad_pairs):
+            if isinstance(teams, ValueError):
+                results.append({"success": False, "error": str(teams), "fixture": fixture})
+            elif pair is None:
+                results.append(self.create_mock_prediction(teams[0], teams[1], prediction_type))
+            else:
+                results.append(self.build_real_prediction(teams[0], teams[1], pair, next(lookups), prediction_type, stats))
         
-        # Compare teams on each metric
-        for metric_key, metric_name in metrics_to_use.items():
-            if metric_key in team1_data and metric_key in team2_data:
-                team1_val = float(team1_data[metric_key]) if pd.notna(team1_data[metric_key]) else 0
-                team2_val = float(team2_data[metric_key]) if pd.notna(team2_data[metric_key]) else 0
-                
-                if team1_val > team2_val:
-                    winner = team1
-                    team1_score += 1
-                elif team2_val > team1_val:
-                    winner = team2
-                    team2_score += 1
-                else:
-                    winner = "Draw"
-                
-                comparisons.append({
-                    "metric": metric_name,
-                    "team1_value": round(team1_val, 1),
-                    "team2_value": round(team2_val, 1),
-                    "winner": winner
-                })
+        return {
+            "success": True,
+            "prediction_type": prediction_type,
+            "results": results,
+            "failed": sum(1 for result in results if not result["success"])
+        }
+
+    def build_real_prediction(self, team1, team2, squads, lookup, prediction_type, stats):
+        """Turn a precomputed matchup lookup into the prediction response."""
+        squad1, squad2 = squads
+        team1_score, team2_score, outcome, compared = lookup
+        labels = metric_set(PASSING_METRICS, prediction_type).labels
         
-        # Determine overall winner
-        if team1_score > team2_score:
-            predicted_winner = team1
-            final_team1_score = 2.1
-            final_team2_score = 1.0
-        elif team2_score > team1_score:
-            predicted_winner = team2
-            final_team1_score = 1.0
-            final_team2_score = 2.1
+        comparisons = [{
+            "metric": labels[metric_key],
+            "team1_value": round(team1_val, 1),
+            "team2_value": round(team2_val, 1),
+            "winner": pick_winner(result, team1, team2)
+        } for metric_key, team1_val, team2_val, result in compared]
+        
+        # Scoreline from the fitted goal model (team1 at home); without one,
+        # fall back to the metric-win count
+        forecast = self.goal_forecast(stats, squad1, squad2)
+        if forecast is not None:
+            final_team1_score = round(forecast["home_goals"], 1)
+            final_team2_score = round(forecast["away_goals"], 1)
+            chances = (forecast["home_win"], forecast["draw"], forecast["away_win"])
+            predicted_winner = (team1, "Draw", team2)[chances.index(max(chances))]
         else:
-            predicted_winner = "Draw"
-            final_team1_score = 1.5
-            final_team2_score = 1.5
+            predicted_winner = pick_winner(outcome, team1, team2)
+            if outcome > 0:
+                final_team1_score = 2.1
+                final_team2_score = 1.0
+            elif outcome < 0:
+                final_team1_score = 1.0
+                final_team2_score = 2.1
+            else:
+                final_team1_score = 1.5
+                final_team2_score = 1.5
         
-        # Create stats summary
+        # Create stats summary from the full metric set
+        summary = self.get_matchup_matrix(stats, 'advanced')
         stats_summary = []
-        for team_name, team_data in [(team1, team1_data), (team2, team2_data)]:
+        for team_name, squad in [(team1, squad1), (team2, squad2)]:
             team_stats = {"Squad": team_name}
-            for metric_key, metric_name in basic_metrics.items():
-                if metric_key in team_data:
-                    val = team_data[metric_key]
-                    team_stats[metric_key] = float(val) if pd.notna(val) else 0
+            for metric_key in summary.metrics:
+                team_stats[metric_key] = summary.value(squad, metric_key)
             stats_summary.append(team_stats)
         
-        return {
+        result = {
             "success": True,
             "prediction_type": prediction_type,
             "teams": [team1, team2],
@@ -251,91 +263,38 @@ class handler(BaseHTTPRequestHandler):
             "stats_summary": stats_summary,
             "disclaimer": "Prediction based on current Premier League season statistics from FBref.com. Results are for entertainment purposes only."
         }
+        if forecast is not None:
+            result["probabilities"] = {
+                "team1_win": round(forecast["home_win"], 3),
+                "draw": round(forecast["draw"], 3),
+                "team2_win": round(forecast["away_win"], 3)
+            }
+            result["most_likely_score"] = forecast["most_likely_score"]
+        return result
+
+    def get_goal_model(self, stats):
+        """The goal model fitted into this snapshot (by refresh.py), or None."""
+        return cached_matrix('goal-model', [stats], lambda: GoalModel.from_meta(stats.meta.get('goal_model')))
+
+    def goal_forecast(self, stats, squad1, squad2):
+        """Expected goals and outcome probabilities with squad1 at home, or None."""
+        model = self.get_goal_model(stats)
+        if model is None:
+            return None
+        with telemetry.stage("goal_model"):
+            # Results pages may spell squads differently from the stats tables
+            resolver = resolver_for(model.teams)
+            home, away = resolver.resolve(squad1), resolver.resolve(squad2)
+            if home is None or away is None or home == away:
+                return None
+            return model.predict(home, away)
 
     def create_mock_prediction(self, team1, team2, prediction_type):
         """Create a mock prediction result as fallback."""
-        
-        # Set random seed based on team names for consistency
-        seed_value = hash(f"{team1.lower()}{team2.lower()}{prediction_type}") % 1000000
-        random.seed(seed_value)
-        
-        # Generate consistent scores based on seed
-        team1_score = round(random.uniform(0.5, 3.0), 1)
-        team2_score = round(random.uniform(0.5, 3.0), 1)
-        
-        # Determine winner
-        if team1_score > team2_score:
-            predicted_winner = team1
-        elif team2_score > team1_score:
-            predicted_winner = team2
-        else:
-            predicted_winner = "Draw"
-        
-        # Create mock comparisons
-        if prediction_type == 'basic':
-            comparisons = [
-                {
-                    "metric": "Passing Accuracy",
-                    "team1_value": round(random.uniform(70, 90), 1),
-                    "team2_value": round(random.uniform(70, 90), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Progressive Passes",
-                    "team1_value": round(random.uniform(50, 120), 1),
-                    "team2_value": round(random.uniform(50, 120), 1),
-                    "winner": random.choice([team1, team2])
-                }
-            ]
-        else:  # advanced
-            comparisons = [
-                {
-                    "metric": "Passing Accuracy",
-                    "team1_value": round(random.uniform(70, 90), 1),
-                    "team2_value": round(random.uniform(70, 90), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Progressive Passes",
-                    "team1_value": round(random.uniform(50, 120), 1),
-                    "team2_value": round(random.uniform(50, 120), 1),
-                    "winner": random.choice([team1, team2])
-                },
-                {
-                    "metric": "Assists",
-                    "team1_value": round(random.uniform(10, 25), 1),
-                    "team2_value": round(random.uniform(10, 25), 1),
-                    "winner": random.choice([team1, team2])
-                }
-            ]
-        
-        # Mock stats summary
-        stats_summary = [
-            {
-                "Squad": team1,
-                "Passing_Accuracy": round(random.uniform(75, 90), 1),
-                "Progressive_Passes": round(random.uniform(60, 100), 0),
-                "Assists": round(random.uniform(12, 20), 1)
-            },
-            {
-                "Squad": team2,
-                "Passing_Accuracy": round(random.uniform(75, 90), 1),
-                "Progressive_Passes": round(random.uniform(60, 100), 0),
-                "Assists": round(random.uniform(12, 20), 1)
-            }
-        ]
-        
-        # Reset random seed
-        random.seed()
-        
-        return {
-            "success": True,
-            "prediction_type": prediction_type,
-            "teams": [team1, team2],
-            "predicted_winner": predicted_winner,
-            "team1_score": team1_score,
-            "team2_score": team2_score,
-            "comparisons": comparisons,
-            "stats_summary": stats_summary,
-            "disclaimer": "This is a demonstration using mock data. Real predictions would require current Premier League statistics."
-        }
\ No newline at end of file
+        telemetry.fallback("mock_prediction")
+        # Seeded by team names so the same fixture always gets the same numbers
+        return mock_prediction(
+            team1, team2, prediction_type, metric_set(PASSING_METRICS, prediction_type),
+            "This is a demonstration using mock data. Real predictions would require current Premier League statistics.",
+            seed=stable_seed(team1, team2, prediction_type)
+        )
@@ -1,307 +1,367 @@
-import subprocess
+from __future__ import annotations
+
 import sys
 import os
-import pandas as pd
-from io import StringIO
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import time
-import random
+from typing import TYPE_CHECKING
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+from cache import TableCache
+from driver_pool import ChromeDriverPool, driver_pool, load_page, new_chrome_driver
+from metrics import FBREF_METRICS, metric_set, pick_winner
+from resolver import FALLBACK_TEAMS, resolver_for
+from snapshot import open_snapshot
+
+if TYPE_CHECKING:
+    # Annotations only; both are imported where they're used, off the snapshot routes
+    import pandas as pd
+    from matchups import MatchupMatrix
+
+# Point at a stand-in server (e.g. the offline benchmarks) instead of FBref
+FBREF_BASE_URL = os.environ.get("PL_FBREF_BASE_URL", "https://fbref.com").rstrip("/")
+PASSING_URL = f"{FBREF_BASE_URL}/en/comps/9/passing/Premier-League-Stats"
+DEFENSE_URL = f"{FBREF_BASE_URL}/en/comps/9/defense/Premier-League-Stats"
+KEEPERS_URL = f"{FBREF_BASE_URL}/en/comps/9/keepers/Premier-League-Stats"
+
+DISCLAIMERS = {
+    "advanced": "This prediction uses key stats but CANNOT account for team form, player fitness, injuries, home/away advantage, or tactical matchups."
+}
+
+# Parsed tables shared by every predictor instance in this process
+table_cache = TableCache("predictor")
+
+# How many tables may be fetched at once (each uncached fetch drives a browser)
+DEFAULT_FETCH_CONCURRENCY = int(os.environ.get("PL_FETCH_CONCURRENCY", 3))
 
 
 class PremierLeaguePredictor:
-    def __init__(self):
-        pass
+    def __init__(self, cache: TableCache = None, max_workers: int = None,
+                 drivers: ChromeDriverPool = None, http=None):
+        self.cache = cache or table_cache
+        self.max_workers = max_workers or DEFAULT_FETCH_CONCURRENCY
+        self.drivers = drivers or driver_pool
+        self.http = http
     
     def _get_chrome_driver(self):
-        """Initialize Chrome driver with proper options."""
-        opts = Options()
-        opts.add_argument("--headless=new")
-        opts.add_argument("--no-sandbox")
-        opts.add_argument("--disable-dev-shm-usage")
-        opts.add_argument("--disable-gpu")
-        opts.add_argument("--disable-extensions")
-        opts.add_argument("--disable-images")
-        opts.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-        return webdriver.Chrome(options=opts)
+        """Initialize a standalone Chrome driver (scrapes borrow from the pool instead)."""
+        return new_chrome_driver()
     
     def pull_premier_league_team_passing(self) -> pd.DataFrame:
         """Scrape Premier League passing stats."""
-        url = "https://fbref.com/en/comps/9/passing/Premier-League-Stats"
-        print("Grabbing passing stats via Chrome...")
-
-        driver = self._get_chrome_driver()
-        try:
-            driver.get(url)
-            time.sleep(random.uniform(3, 5))
-            html = driver.page_source
-        finally:
-            driver.quit()
-
-        # Parse the main stats table
-        df = pd.read_html(StringIO(html), match="Squad")[0]
-
-        # Flatten multi-index columns
-        df.columns = ["_".join(col).strip() if isinstance(col, tuple) else col
-                      for col in df.columns]
-
-        # Rename ugly columns
-        rename = {
-            "Unnamed: 0_level_0_Squad": "Squad",
-            "Unnamed: 1_level_0_# Pl": "Players",
-            "Unnamed: 2_level_0_90s": "90s",
-            "Unnamed: 17_level_0_Ast": "Ast",
-            "Unnamed: 18_level_0_xAG": "xAG",
-            "Unnamed: 21_level_0_KP": "KP",
-            "Unnamed: 22_level_0_1/3": "1/3",
-            "Unnamed: 23_level_0_PPA": "PPA",
-            "Unnamed: 24_level_0_CrsPA": "CrsPA",
-            "Unnamed: 25_level_0_PrgP": "PrgP"
-        }
-        return df.rename(columns=rename)
+        # Same page and parse as the generic scraper, so both share one cache entry
+        df = self.scrape_fbref_table(PASSING_URL, "Squad")
+        return df.rename(columns={"# Pl": "Players"})
 
     def scrape_fbref_table(self, url: str, match_keyword: str) -> pd.DataFrame:
-        """A generic function to scrape a stats table from a given FBref URL."""
-        print(f"Grabbing '{match_keyword}' data via Chrome...")
-        driver = self._get_chrome_driver()
+        """A generic function to scrape a stats table from a given FBref URL.
+
+        Parsed tables are cached per URL (memory and disk) with stale-while-revalidate.
+        """
+        return self.cache.get_or_fetch(
+            f"{url}#{match_keyword}",
+            lambda: self._scrape_fbref_table(url, match_keyword)
+        )
+
+    def _scrape_fbref_table(self, url: str, match_keyword: str) -> pd.DataFrame:
+        """Download and parse a stats table, bypassing the cache."""
+        result = self._get_fetcher().fetch(url, fallback=self._fetch_with_browser)
+        if result.not_modified:
+            # Page unchanged since the cached parse: skip re-parsing it
+            entry = self.cache.get_entry(f"{url}#{match_keyword}")
+            if entry is not None:
+                return entry.value
+
+        # pandas and lxml load only here, so serving a snapshot never imports them
+        from extract import extract_table
+
+        # Parse only the squad table (even when it sits in an HTML comment)
+        with telemetry.stage("parse"):
+            return extract_table(result.html, match=match_keyword)
+
+    def _get_fetcher(self):
+        """The shared HTTP fetcher, imported on first use (requests is only needed on a cache miss)."""
+        if self.http is None:
+            from fetcher import fetcher
+            self.http = fetcher
+        return self.http
+
+    def _fetch_with_browser(self, url: str) -> str:
+        """Render a page in a pooled Chrome when plain HTTP doesn't return the table.
+
+        Returns as soon as the squad table is in the page (see ``load_page``).
+        """
+        print(f"Grabbing {url} via Chrome...")
         try:
-            driver.get(url)
-            time.sleep(random.uniform(3, 5))
-            html = driver.page_source
-        finally:
-            driver.quit()
-
-        df = pd.read_html(StringIO(html), match=match_keyword)[0]
-
-        # Robustly flatten multi-level column headers
-        def flatten_columns(col):
-            if isinstance(col, tuple):
-                if 'Unnamed' in col[0]:
-                    return col[1]
-                return f"{col[0]}_{col[1]}"
-            return col
-        df.columns = [flatten_columns(col) for col in df.columns]
-        return df
+            with self.drivers.driver() as driver:
+                html = load_page(driver, url)
+            telemetry.count("upstream", "browser:ok")
+            return html
+        except Exception:
+            telemetry.count("upstream", "browser:error")
+            raise
+
+    def scrape_fbref_tables(self, urls: list[str], match_keyword: str = "Squad") -> list[pd.DataFrame]:
+        """Scrape several tables concurrently, returned in the order of ``urls``.
+
+        At most ``max_workers`` fetches run at once, so wall time is roughly
+        that of the slowest table rather than the sum of all of them.
+        """
+        if len(urls) <= 1 or self.max_workers <= 1:
+            return [self.scrape_fbref_table(url, match_keyword) for url in urls]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            return list(pool.map(lambda url: self.scrape_fbref_table(url, match_keyword), urls))
 
     def filter_teams(self, df: pd.DataFrame, teams: list[str]) -> pd.DataFrame:
         """Filter dataframe for specific teams."""
         return df[df["Squad"].isin(teams)]
 
-    def merge_and_filter(self, teams: list[str], *dataframes: pd.DataFrame) -> pd.DataFrame:
-        """Merges multiple dataframes on 'Squad' and filters for specified teams."""
-        df_merged = dataframes[0]
-        for df_next in dataframes[1:]:
-            df_merged = pd.merge(df_merged, df_next, on="Squad", how="left", suffixes=('', '_drop'))
-            df_merged.drop([col for col in df_merged.columns if 'drop' in col], axis=1, inplace=True)
+    def merge_tables(self, *dataframes: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+        """Left-joins dataframes on 'Squad', keeping the first copy of shared columns."""
+        with telemetry.stage("merge"):
+            return self._join_on_squad(dataframes, columns=columns)
 
-        return df_merged[df_merged["Squad"].isin(teams)].copy()
+    def merge_and_filter(self, teams: list[str], *dataframes: pd.DataFrame,
+                         columns: list[str] | None = None) -> pd.DataFrame:
+        """Joins dataframes on 'Squad' for the specified teams only."""
+        with telemetry.stage("merge"):
+            return self._join_on_squad(dataframes, teams=teams, columns=columns)
 
-    def basic_prediction(self, teams: list[str]):
-        """Basic prediction using passing stats."""
+    def _join_on_squad(self, dataframes, teams=None, columns=None) -> pd.DataFrame:
+        """Single indexed join of squad tables.
+
+        Rows follow the first table, narrowed to ``teams`` before any data
+        is touched. Every table is indexed by squad once, and each wanted
+        column (``columns``, default: all) is gathered from the first table
+        that has it, so extra tables only add the columns they supply.
+        """
+        import numpy as np
+        import pandas as pd
+
+        squads = list(dict.fromkeys(dataframes[0]["Squad"].tolist()))
+        if teams is not None:
+            wanted_teams = set(teams)
+            squads = [squad for squad in squads if squad in wanted_teams]
+
+        wanted = None if columns is None else [col for col in columns if col != "Squad"]
+        data = {"Squad": squads}
+        for df in dataframes:
+            own = [col for col in (df.columns if wanted is None else wanted)
+                   if col in df.columns and col not in data]
+            if not own:
+                continue
+
+            positions = {}
+            for i, squad in enumerate(df["Squad"].tolist()):
+                positions.setdefault(squad, i)
+            rows = np.array([positions.get(squad, -1) for squad in squads], dtype=np.intp)
+            missing = rows < 0
+
+            for col in own:
+                values = df[col].to_numpy()[rows]
+                if missing.any():
+                    # Left join: squads absent from this table get NaN
+                    values = values.astype(float if values.dtype.kind in "iufb" else object)
+                    values[missing] = np.nan
+                data[col] = values
+
+        return pd.DataFrame(data)
+
+    def source_urls(self) -> dict:
+        """Stats table name -> FBref URL, as referenced by ``Metric.source``."""
+        return {"passing": PASSING_URL, "defense": DEFENSE_URL, "keepers": KEEPERS_URL}
+
+    def published_snapshot(self):
+        """The stats snapshot published by refresh.py; predictions never scrape."""
+        snapshot = open_snapshot()
+        if snapshot is None:
+            raise ValueError("No published stats snapshot yet; run python api/refresh.py")
+        return snapshot
+
+    def data_version(self, prediction_type: str, teams: list[str] | None = None):
+        """Version of the stats behind a prediction type, or None when nothing is published yet.
+
+        It covers the metric set ``prediction_type`` selects, so basic and
+        advanced predictions never share a version. With ``teams``, only
+        their rows count: it changes only when a refresh changes one of
+        those teams (see ``Snapshot.rows_version``). Cheap (no parsing or
+        matrix building), so handlers can use it to answer conditional
+        requests before predicting.
+        """
+        snapshot = open_snapshot()
+        if snapshot is None:
+            return None
+        metrics = metric_set(FBREF_METRICS, prediction_type, default="advanced")
+        if teams:
+            resolver = resolver_for(snapshot.squads)
+            squads = [resolver.resolve(team) for team in teams]
+            if all(squad is not None for squad in squads):
+                return snapshot.rows_version(squads, metrics.name)
+        return f"{snapshot.version}:{metrics.name}"
+
+    def _load_matchups(self, prediction_type: str):
+        """Matrix, per-squad summaries and metric labels for a prediction type.
+
+        The matrix normally comes precomputed in the snapshot (refresh.py
+        stores it), so setting up a new snapshot only collects the summaries;
+        then every fixture is a lookup. Also returns the snapshot's squads for error messages.
+        """
+        # numpy loads with the first prediction, not for /teams
+        from matchups import cached_matrix, snapshot_matrix
+
+        metrics = metric_set(FBREF_METRICS, prediction_type, default="advanced")
+        snapshot = self.published_snapshot()
+
+        def build():
+            summary = [col for col in metrics.summary if col == "Squad" or col in snapshot]
+            summaries = {}
+            for squad in snapshot.index:
+                summaries[squad] = {col: squad if col == "Squad" else snapshot.value(squad, col)
+                                    for col in summary}
+            return (
+                snapshot_matrix(snapshot, metrics, skip_missing=True),
+                summaries
+            )
+
+        matrix, summaries = cached_matrix(metrics.name, [snapshot], build)
+        return matrix, summaries, metrics.labels, snapshot.squads
+
+    def _matchup_response(self, prediction_type: str, teams: list[str], lookup: tuple,
+                          matrix: MatchupMatrix, labels: dict, summaries: dict):
+        """Build a prediction response from a precomputed matchup lookup."""
+        team1_score, team2_score, outcome, compared = lookup
+
+        comparisons = [{
+            "metric": labels[metric],
+            "team1_value": t1_val,
+            "team2_value": t2_val,
+            "winner": pick_winner(result, teams[0], teams[1])
+        } for metric, t1_val, t2_val, result in compared]
+
+        # Summary rows keep the table's order, like the filtered DataFrame did
+        ordered = sorted(set(teams), key=matrix.index.get)
+
+        result = {
+            "success": True,
+            "prediction_type": prediction_type,
+            "teams": teams,
+            "predicted_winner": pick_winner(outcome, teams[0], teams[1]),
+            "team1_score": team1_score,
+            "team2_score": team2_score,
+            "comparisons": comparisons,
+            "stats_summary": [summaries[team] for team in ordered]
+        }
+        if prediction_type in DISCLAIMERS:
+            result["disclaimer"] = DISCLAIMERS[prediction_type]
+        return result
+
+    def _predict(self, prediction_type: str, teams: list[str], missing_error: str):
         try:
-            df = self.pull_premier_league_team_passing()
-            df_filt = self.filter_teams(df, teams)
-            
-            if len(df_filt) < 2:
+            matrix, summaries, labels, squads = self._load_matchups(prediction_type)
+            # Accept aliases and near-misses ("man city", "Nottingham Forest")
+            with telemetry.stage("lookup"):
+                resolver = resolver_for(matrix.squads)
+                teams = [resolver.resolve(team) or team for team in teams]
+                lookup = matrix.lookup(teams[0], teams[1])
+
+            if teams[0] == teams[1] or lookup is None:
                 return {
                     "success": False,
-                    "error": f"Could not find data for both teams: {teams}",
-                    "available_teams": df["Squad"].tolist()
+                    "error": f"{missing_error}: {teams}",
+                    "available_teams": list(squads)
                 }
-            
-            # Compare basic stats
-            team1_data = df_filt[df_filt["Squad"] == teams[0]].iloc[0]
-            team2_data = df_filt[df_filt["Squad"] == teams[1]].iloc[0]
-            
-            # Simple comparison based on completion percentage and assists
-            team1_score = 0
-            team2_score = 0
-            
-            comparisons = []
-            
-            # Compare completion percentage
-            if "Total_Cmp%" in df_filt.columns:
-                t1_cmp = pd.to_numeric(team1_data["Total_Cmp%"], errors='coerce')
-                t2_cmp = pd.to_numeric(team2_data["Total_Cmp%"], errors='coerce')
-                if t1_cmp > t2_cmp:
-                    team1_score += 1
-                    winner = teams[0]
-                elif t2_cmp > t1_cmp:
-                    team2_score += 1
-                    winner = teams[1]
-                else:
-                    winner = "Draw"
-                
-                comparisons.append({
-                    "metric": "Pass Completion %",
-                    "team1_value": t1_cmp,
-                    "team2_value": t2_cmp,
-                    "winner": winner
-                })
-            
-            # Compare assists
-            if "Ast" in df_filt.columns:
-                t1_ast = pd.to_numeric(team1_data["Ast"], errors='coerce')
-                t2_ast = pd.to_numeric(team2_data["Ast"], errors='coerce')
-                if t1_ast > t2_ast:
-                    team1_score += 1
-                    winner = teams[0]
-                elif t2_ast > t1_ast:
-                    team2_score += 1
-                    winner = teams[1]
-                else:
-                    winner = "Draw"
-                
-                comparisons.append({
-                    "metric": "Assists",
-                    "team1_value": t1_ast,
-                    "team2_value": t2_ast,
-                    "winner": winner
-                })
-            
-            if team1_score > team2_score:
-                predicted_winner = teams[0]
-            elif team2_score > team1_score:
-                predicted_winner = teams[1]
-            else:
-                predicted_winner = "Draw"
-            
-            return {
-                "success": True,
-                "prediction_type": "basic",
-                "teams": teams,
-                "predicted_winner": predicted_winner,
-                "team1_score": team1_score,
-                "team2_score": team2_score,
-                "comparisons": comparisons,
-                "stats_summary": df_filt[["Squad", "Total_Cmp", "Total_Att", "Total_Cmp%", "Ast"]].to_dict('records')
-            }
-            
+
+            return self._matchup_response(prediction_type, teams, lookup, matrix, labels, summaries)
+
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
 
+    def basic_prediction(self, teams: list[str]):
+        """Basic prediction using passing stats."""
+        return self._predict("basic", teams, "Could not find data for both teams")
+
     def advanced_prediction(self, teams: list[str]):
         """Advanced prediction using multiple stats tables."""
-        try:
-            # Scrape multiple tables
-            df_passing = self.scrape_fbref_table(
-                "https://fbref.com/en/comps/9/passing/Premier-League-Stats", 
-                "Squad"
-            )
-            df_defense = self.scrape_fbref_table(
-                "https://fbref.com/en/comps/9/defense/Premier-League-Stats", 
-                "Squad"
-            )
-            df_keepers = self.scrape_fbref_table(
-                "https://fbref.com/en/comps/9/keepers/Premier-League-Stats", 
-                "Squad"
-            )
+        return self._predict("advanced", teams, "Could not find complete data for both teams")
 
-            # Merge and filter data
-            df_merged_filtered = self.merge_and_filter(teams, df_passing, df_defense, df_keepers)
-            
-            if len(df_merged_filtered) < 2:
-                return {
-                    "success": False,
-                    "error": f"Could not find complete data for both teams: {teams}",
-                    "available_teams": df_passing["Squad"].tolist()
-                }
+    def batch_prediction(self, fixtures: list, prediction_type: str = "basic"):
+        """Predict many fixtures at once from a single load of the stats tables.
 
-            team1_stats = df_merged_filtered[df_merged_filtered["Squad"] == teams[0]].iloc[0]
-            team2_stats = df_merged_filtered[df_merged_filtered["Squad"] == teams[1]].iloc[0]
+        ``fixtures`` items are ``{"team1": ..., "team2": ...}`` dicts or
+        ``[team1, team2]`` lists. Fixtures that fail are reported in place.
+        """
+        from matchups import parse_fixtures
 
-            # Define balanced metrics for offense and defense
-            metrics_to_compare = {
-                "Ast": "Assists (Goal Creation)",
-                "PrgP": "Progressive Passes (Attacking Intent)",
-                "Tackles_TklW": "Tackles Won (Ball Winning)",
-                "Performance_Saves": "Goalkeeper Saves (Shot Stopping)"
+        try:
+            parsed = parse_fixtures(fixtures)
+            matrix, summaries, labels, squads = self._load_matchups(prediction_type)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "prediction_type": prediction_type
             }
 
-            team1_score, team2_score = 0, 0
-            comparisons = []
-
-            for metric, description in metrics_to_compare.items():
-                if metric not in df_merged_filtered.columns:
-                    continue
-
-                t1_val = pd.to_numeric(team1_stats[metric], errors='coerce')
-                t2_val = pd.to_numeric(team2_stats[metric], errors='coerce')
-
-                if pd.isna(t1_val) or pd.isna(t2_val):
-                    continue
-
-                if t1_val > t2_val:
-                    team1_score += 1
-                    winner = teams[0]
-                elif t2_val > t1_val:
-                    team2_score += 1
-                    winner = teams[1]
-                else:
-                    winner = "Draw"
-
-                comparisons.append({
-                    "metric": description,
-                    "team1_value": t1_val,
-                    "team2_value": t2_val,
-                    "winner": winner
-                })
+        with telemetry.stage("lookup"):
+            resolver = resolver_for(matrix.squads)
+            parsed = [
+                teams if isinstance(teams, ValueError)
+                else tuple(resolver.resolve(team) or team for team in teams)
+                for teams in parsed
+            ]
+            valid = [teams for teams in parsed if not isinstance(teams, ValueError)]
+            lookups = iter(matrix.lookup_many(valid))
 
-            if team1_score > team2_score:
-                predicted_winner = teams[0]
-            elif team2_score > team1_score:
-                predicted_winner = teams[1]
-            else:
-                predicted_winner = "Draw"
+        results = []
+        for fixture, teams in zip(fixtures, parsed):
+            if isinstance(teams, ValueError):
+                results.append({"success": False, "error": str(teams), "fixture": fixture})
+                continue
 
-            # Get summary stats
-            cols_to_show = ["Squad", "Ast", "PrgP", "Tackles_TklW", "Performance_Saves"]
-            cols_to_show = [col for col in cols_to_show if col in df_merged_filtered.columns]
-            
-            return {
-                "success": True,
-                "prediction_type": "advanced",
-                "teams": teams,
-                "predicted_winner": predicted_winner,
-                "team1_score": team1_score,
-                "team2_score": team2_score,
-                "comparisons": comparisons,
-                "stats_summary": df_merged_filtered[cols_to_show].to_dict('records'),
-                "disclaimer": "This prediction uses key stats but CANNOT account for team form, player fitness, injuries, home/away advantage, or tactical matchups."
-            }
+            lookup = next(lookups)
+            if lookup is None or teams[0] == teams[1]:
+                results.append({
+                    "success": False,
+                    "error": f"Could not find data for both teams: {list(teams)}",
+                    "fixture": fixture
+                })
+                continue
+            results.append(self._matchup_response(prediction_type, list(teams), lookup,
+                                                  matrix, labels, summaries))
 
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        response = {
+            "success": True,
+            "prediction_type": prediction_type,
+            "results": results,
+            "failed": sum(1 for result in results if not result["success"])
+        }
+        if response["failed"]:
+            response["available_teams"] = list(squads)
+        return response
 
     def get_available_teams(self):
         """Get list of available teams."""
         try:
-            df = self.pull_premier_league_team_passing()
-            teams = df["Squad"].tolist()
+            teams = list(self.published_snapshot().index)
             if len(teams) > 0:
                 return {
                     "success": True,
                     "teams": sorted(teams)
                 }
             else:
-                raise Exception("No teams found in scraped data")
+                raise Exception("No teams found in the published stats")
         except Exception as e:
             # Return fallback list with error info
-            fallback_teams = [
-                'Arsenal', 'Aston Villa', 'Brighton', 'Burnley', 'Chelsea', 
-                'Crystal Palace', 'Everton', 'Fulham', 'Liverpool', 'Luton Town',
-                'Manchester City', 'Manchester Utd', 'Newcastle Utd', 'Nottingham Forest',
-                'Sheffield Utd', 'Tottenham', 'West Ham', 'Wolves', 'Bournemouth', 'Brentford'
-            ]
+            telemetry.fallback("teams")
             return {
                 "success": True,
-                "teams": fallback_teams,
+                "teams": FALLBACK_TEAMS,
                 "fallback": True,
                 "error": str(e)
             }
\ No newline at end of file
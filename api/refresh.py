@@ -0,0 +1,223 @@
+"""Refresh job: scrape, validate and publish the team stats snapshot.
+
+Every table the predictions read is fetched, joined on squad and checked;
+the goal model is refitted from the latest results and every prediction
+matrix is precomputed; then a new snapshot version, matrices included, is
+published atomically (see ``snapshot.publish_snapshot``) and appended to
+the history store (history.py). The API handlers only read the published
+snapshot and never scrape, so a slow or failing FBref never reaches a
+request: they keep serving the last good version.
+
+    python api/refresh.py                  # once (exit status 1 on failure)
+    python api/refresh.py --interval 3600  # keep refreshing every hour
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from cache import TableCache
+from matchups import precompute_arrays
+from metrics import FBREF_METRICS, PASSING_COLUMNS, PASSING_METRICS
+from snapshot import changed_squads, default_snapshot_path, open_snapshot, publish_snapshot
+
+DEFAULT_INTERVAL = int(os.environ.get("PL_REFRESH_INTERVAL", 60 * 60))
+# The league has 20 squads; fewer means a partial or broken page
+MIN_SQUADS = int(os.environ.get("PL_MIN_SQUADS", 18))
+
+# Matrices the handlers compare with, as (metric sets, build options); they
+# are stored in the snapshot so workers attach to them instead of building
+PRECOMPUTED_MATRICES = [
+    (FBREF_METRICS, {"skip_missing": True}),   # predictor.py
+    (PASSING_METRICS, {"fill_value": 0}),      # predict.py
+]
+
+
+def required_columns():
+    """Every column a registered metric set compares or summarises."""
+    columns = []
+    for registry in (FBREF_METRICS, PASSING_METRICS):
+        for metrics in registry.values():
+            columns += metrics.columns + metrics.summary[1:]
+    return list(dict.fromkeys(columns))
+
+
+def scrape_tables(predictor=None):
+    """Fetch every stats table; returns (predictor, {source: DataFrame})."""
+    # Deferred: only the refresher needs the scraping stack
+    from predictor import PremierLeaguePredictor
+
+    # Always revalidate with FBref; unchanged pages still come back as cheap 304s
+    predictor = predictor or PremierLeaguePredictor(
+        cache=TableCache("refresh", default_ttl=0, default_stale_ttl=0))
+    urls = predictor.source_urls()
+    tables = predictor.scrape_fbref_tables(list(urls.values()))
+    return predictor, dict(zip(urls, tables))
+
+
+def build_columns(predictor, tables):
+    """Join the tables on squad; returns (squads, {column: values}).
+
+    Only numeric columns are kept. The passing columns are also stored
+    under the names /api/predict uses (``PASSING_COLUMNS``).
+    """
+    import pandas as pd
+
+    df = predictor.merge_tables(*tables.values())
+    squads = [str(squad) for squad in df["Squad"]]
+    columns = {}
+    for name in df.columns:
+        if name == "Squad":
+            continue
+        values = pd.to_numeric(df[name], errors="coerce")
+        if values.notna().any():
+            columns[str(name)] = values.tolist()
+    for column, alias in PASSING_COLUMNS.items():
+        if column in columns:
+            columns.setdefault(alias, columns[column])
+    return squads, columns
+
+
+def validate(squads, columns):
+    """Raise ValueError describing everything wrong with a scraped data set."""
+    problems = []
+    if len(squads) < MIN_SQUADS:
+        problems.append(f"only {len(squads)} squads (expected at least {MIN_SQUADS})")
+    duplicates = sorted({squad for squad in squads if squads.count(squad) > 1})
+    if duplicates:
+        problems.append(f"duplicate squads {duplicates}")
+    for name in required_columns():
+        if name not in columns:
+            problems.append(f"missing column {name}")
+            continue
+        missing = sum(1 for value in columns[name] if math.isnan(value))
+        if missing:
+            problems.append(f"{name} missing for {missing} squads")
+    if problems:
+        raise ValueError("Scraped stats failed validation: " + "; ".join(problems))
+
+
+def build_arrays(squads, columns, previous=None, changed=None):
+    """Every precomputed matrix array, for ``publish_snapshot(arrays=...)``.
+
+    With the ``previous`` snapshot and the squads ``changed`` since, only
+    the matchups of those squads are recomputed.
+    """
+    arrays = {}
+    for registry, options in PRECOMPUTED_MATRICES:
+        for metrics in registry.values():
+            arrays.update(precompute_arrays(squads, columns, metrics, previous=previous,
+                                            changed=changed, **options))
+    return arrays
+
+
+def refit_meta(meta, fixtures_url=None):
+    """``meta`` with the goal model and season refitted from the results page.
+
+    When the results can't be fetched the previous model and season are
+    kept, so stats still get published.
+    """
+    from goal_model import FIXTURES_URL, fetch_schedule, updated_meta
+
+    try:
+        matches, remaining = fetch_schedule(fixtures_url or FIXTURES_URL)
+        if not matches:
+            raise ValueError("no played matches found")
+        return updated_meta(meta, matches, remaining)
+    except Exception as e:
+        print(f"Keeping the previous goal model: {e}")
+        return meta
+
+
+def _unchanged(snapshot, changed, meta, arrays):
+    """True when ``snapshot`` already holds exactly this data (no ``changed`` squads)."""
+    if changed != [] or snapshot.meta != meta:
+        return False
+    # Same rows; the matrices only differ if their definitions did
+    stored = {name for name in arrays if memoryview(arrays[name]).nbytes}
+    return set(snapshot.arrays) == stored
+
+
+def record_history(squads, columns, version, created_at, history=None):
+    """Append a published snapshot to the history store; failures are only logged."""
+    from history import HistoryStore
+
+    store = history
+    try:
+        store = store or HistoryStore()
+        season, date = store.record(squads, columns, version, created_at)
+        print(f"Recorded snapshot {version} in the history as {season} {date}")
+    except Exception as e:
+        print(f"Could not record snapshot {version} in the history: {e}")
+    finally:
+        if history is None and store is not None:
+            store.close()
+
+
+def refresh(path=None, fixtures_url=None, predictor=None, history=None):
+    """Scrape, validate and publish once; returns the current snapshot version.
+
+    Raises (leaving the published snapshot untouched) when scraping or
+    validation fails. Unchanged data is not republished, so ETags and edge
+    caches stay valid. Published snapshots are also added to ``history``
+    (default: a ``HistoryStore`` at PL_HISTORY_PATH).
+    """
+    path = path or default_snapshot_path()
+    started = time.perf_counter()
+
+    predictor, tables = scrape_tables(predictor)
+    squads, columns = build_columns(predictor, tables)
+    validate(squads, columns)
+
+    current = open_snapshot(path, max_age=None)
+    # Diff against the published rows: after a midweek round only the
+    # teams that played changed, and only their matchups are recomputed
+    changed = changed_squads(current, squads, columns)
+    arrays = build_arrays(squads, columns, current, changed)
+    meta = {key: value for key, value in (current.meta if current else {}).items()
+            if key in ("goal_model", "season")}
+    meta = refit_meta(meta, fixtures_url)
+    meta["source"] = "refresh"
+    meta["tables"] = predictor.source_urls()
+
+    if current is not None and _unchanged(current, changed, meta, arrays):
+        print(f"Stats unchanged, keeping snapshot {current.version}")
+        return current.version
+    if changed is not None:
+        print(f"{len(changed)} of {len(squads)} squads changed: {', '.join(changed) or 'none'}")
+
+    created_at = time.time()
+    version = publish_snapshot(squads, columns, meta=meta, path=path, arrays=arrays,
+                               created_at=created_at)
+    record_history(squads, columns, version, created_at, history)
+    print(f"Published snapshot {version}: {len(squads)} squads, {len(columns)} columns "
+          f"in {time.perf_counter() - started:.1f}s")
+    return version
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scrape FBref and publish the team stats snapshot.")
+    parser.add_argument("--snapshot", default=None, help="snapshot path (default: PL_SNAPSHOT_PATH)")
+    parser.add_argument("--fixtures-url", default=None, help="scores and fixtures page for the goal model")
+    parser.add_argument("--interval", type=int, default=0, nargs="?", const=DEFAULT_INTERVAL,
+                        help=f"keep refreshing every INTERVAL seconds (default {DEFAULT_INTERVAL})")
+    args = parser.parse_args(argv)
+
+    while True:
+        try:
+            refresh(args.snapshot, args.fixtures_url)
+            status = 0
+        except Exception as e:
+            print(f"Refresh failed, keeping the published snapshot: {e}")
+            status = 1
+        if not args.interval:
+            return status
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
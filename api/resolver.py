@@ -0,0 +1,183 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+# Shown when live data is unavailable. Names match FBref's Squad column so
+# every team offered to the user resolves exactly.
+FALLBACK_TEAMS = [
+    'Arsenal', 'Aston Villa', 'Brighton', 'Burnley', 'Chelsea',
+    'Crystal Palace', 'Everton', 'Fulham', 'Liverpool', 'Luton Town',
+    'Manchester City', 'Manchester Utd', 'Newcastle Utd', "Nott'ham Forest",
+    'Sheffield Utd', 'Tottenham', 'West Ham', 'Wolves', 'Bournemouth', 'Brentford'
+]
+
+# FBref squad name -> other names people use for it
+TEAM_ALIASES = {
+    'Arsenal': ['arsenal fc', 'gunners'],
+    'Aston Villa': ['villa'],
+    'Bournemouth': ['afc bournemouth', 'cherries'],
+    'Brentford': ['bees'],
+    'Brighton': ['brighton and hove albion', 'brighton & hove albion', 'brighton hove albion', 'seagulls'],
+    'Burnley': ['clarets'],
+    'Chelsea': ['chelsea fc'],
+    'Crystal Palace': ['palace'],
+    'Everton': ['toffees'],
+    'Fulham': ['cottagers'],
+    'Ipswich Town': ['ipswich'],
+    'Leeds United': ['leeds', 'leeds utd'],
+    'Leicester City': ['leicester', 'foxes'],
+    'Liverpool': ['liverpool fc'],
+    'Luton Town': ['luton'],
+    'Manchester City': ['man city', 'mcfc'],
+    'Manchester Utd': ['man utd', 'man u', 'man united', 'manchester united', 'mufc'],
+    'Newcastle Utd': ['newcastle', 'newcastle united', 'magpies'],
+    "Nott'ham Forest": ['nottingham forest', 'nottm forest', 'forest'],
+    'Sheffield Utd': ['sheffield united', 'sheffield', 'blades'],
+    'Southampton': ['saints'],
+    'Sunderland': ['black cats'],
+    'Tottenham': ['tottenham hotspur', 'spurs'],
+    'West Ham': ['west ham united', 'hammers'],
+    'Wolves': ['wolverhampton', 'wolverhampton wanderers'],
+}
+
+# Fuzzy matches scoring below this are treated as unknown teams
+MIN_FUZZY_SCORE = 0.6
+# ...and so are matches that don't beat the runner-up squad by this much
+MIN_FUZZY_MARGIN = 0.15
+
+# Words a full club name may add around a known name ("Everton FC")
+_FILLER_TOKENS = frozenset({"fc", "afc", "cf", "the", "club", "football"})
+
+_PUNCTUATION = re.compile(r"[^a-z0-9 ]+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(name):
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    name = name.lower().replace("&", " and ")
+    return " ".join(_PUNCTUATION.sub("", name).split())
+
+
+def _contains_tokens(tokens, part):
+    """Where ``part`` occurs as a run of whole tokens in ``tokens``, or -1."""
+    n = len(part)
+    for i in range(len(tokens) - n + 1):
+        if tokens[i:i + n] == part:
+            return i
+    return -1
+
+
+def _token_match(key, candidate):
+    """How ``key`` relates to ``candidate`` word for word.
+
+    "part" when ``key`` is a run of the candidate's words ("hotspur") or is
+    the candidate plus filler ("everton fc"); "longer" when it adds other
+    words to the candidate, so names another club ("sheffield wednesday");
+    otherwise None.
+    """
+    key_tokens, candidate_tokens = key.split(), candidate.split()
+    if _contains_tokens(candidate_tokens, key_tokens) >= 0:
+        return "part"
+    start = _contains_tokens(key_tokens, candidate_tokens)
+    if start < 0:
+        return None
+    rest = key_tokens[:start] + key_tokens[start + len(candidate_tokens):]
+    return "part" if all(token in _FILLER_TOKENS for token in rest) else "longer"
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TeamResolver:
+    """Resolves user-supplied team names to the squad names of one snapshot.
+
+    Normalized squad names and aliases go into a dict for constant-time
+    exact lookups; a trigram index backs fuzzy matching, ranked by Dice
+    similarity with a boost when the name is a whole-word part of exactly
+    one squad's names ("Hotspur", "Nottingham").
+    """
+
+    def __init__(self, squads, aliases=TEAM_ALIASES):
+        self.squads = [squad for squad in squads if isinstance(squad, str)]
+        self._order = {}
+        self._keys = {}
+        for i, squad in enumerate(self.squads):
+            self._order.setdefault(squad, i)
+            self._keys.setdefault(normalize(squad), squad)
+
+        for canonical, names in aliases.items():
+            squad = self._keys.get(normalize(canonical))
+            if squad is None:
+                continue
+            for alias in names:
+                self._keys.setdefault(normalize(alias), squad)
+
+        self._key_grams = {key: _trigrams(key) for key in self._keys}
+        self._gram_index = defaultdict(list)
+        for key, grams in self._key_grams.items():
+            for gram in grams:
+                self._gram_index[gram].append(key)
+
+    def resolve(self, name):
+        """The best matching squad for ``name``, or None."""
+        if not isinstance(name, str):
+            return None
+        squad = self._keys.get(normalize(name))
+        if squad is not None:
+            return squad
+
+        # Clubs outside the league ("Southampton", "West Brom") and names
+        # shared by several squads ("United", "Manchester") resolve to None
+        # rather than to whichever squad happens to score highest.
+        ranked = self.candidates(name, limit=2)
+        if not ranked or ranked[0][1] < MIN_FUZZY_SCORE:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < MIN_FUZZY_MARGIN:
+            return None
+        return ranked[0][0]
+
+    def candidates(self, name, limit=5):
+        """Squads ranked by similarity to ``name`` as (squad, score) pairs."""
+        key = normalize(name)
+        if not key:
+            return []
+        grams = _trigrams(key)
+
+        shared = Counter()
+        for gram in grams:
+            for candidate in self._gram_index.get(gram, ()):
+                shared[candidate] += 1
+
+        scores = {}
+        token_matches = set()
+        for candidate, common in shared.items():
+            match = _token_match(key, candidate)
+            if match == "longer":
+                continue
+            squad = self._keys[candidate]
+            score = 2 * common / (len(grams) + len(self._key_grams[candidate]))
+            if score > scores.get(squad, 0):
+                scores[squad] = score
+            if match == "part" and len(key) >= 3:
+                token_matches.add(squad)
+
+        if len(token_matches) == 1:
+            squad = token_matches.pop()
+            scores[squad] = 0.75 + 0.25 * scores[squad]
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self._order[item[0]]))
+        return ranked[:limit]
+
+
+@lru_cache(maxsize=8)
+def _resolver_for(squads):
+    return TeamResolver(squads)
+
+
+def resolver_for(squads):
+    """The shared resolver for a snapshot's squad list (built once per distinct list)."""
+    return _resolver_for(tuple(squads))
@@ -0,0 +1,222 @@
+"""JSON responses with HTTP caching headers, shared by the API handlers.
+
+Cacheable responses carry an ETag derived from the data version and the
+request (prediction type, team pair, ...) and a Cache-Control that lets
+the CDN serve them (``s-maxage``) and keep serving them while it
+revalidates in the background (``stale-while-revalidate``). A request
+whose If-None-Match matches gets a bodiless 304. Errors are never cached.
+
+Bodies are compressed with the best encoding the client accepts (brotli
+when the optional ``brotli`` package is installed, else gzip), and a
+``fields`` projection trims predictions down to the keys a client asks
+for. The encoded bytes of cacheable GET responses are kept per URL and
+ETag (which carries the data version), so hot responses skip both
+serialization and compression.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+BROWSER_MAX_AGE = int(os.environ.get("PL_BROWSER_MAX_AGE", 60))
+EDGE_MAX_AGE = int(os.environ.get("PL_EDGE_MAX_AGE", 15 * 60))
+EDGE_STALE = int(os.environ.get("PL_EDGE_STALE", 24 * 60 * 60))
+
+NO_STORE = "no-store"
+
+# Smaller bodies are sent as they are; compressing them saves next to nothing
+MIN_COMPRESS_BYTES = int(os.environ.get("PL_MIN_COMPRESS_BYTES", 512))
+# Encoded bodies of cacheable responses kept per process
+MAX_CACHED_BODIES = int(os.environ.get("PL_CACHED_BODIES", 512))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Supported encodings, most preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Kept by every projection, so failures still say what went wrong
+ALWAYS_FIELDS = ("success", "error", "fixture")
+
+
+def cache_control(max_age=BROWSER_MAX_AGE, s_maxage=EDGE_MAX_AGE, stale_while_revalidate=EDGE_STALE):
+    return f"public, max-age={max_age}, s-maxage={s_maxage}, stale-while-revalidate={stale_while_revalidate}"
+
+
+def make_etag(*parts):
+    """Strong ETag for a response identified by ``parts`` (data version first)."""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def etag_matches(headers, etag):
+    """True when the request's If-None-Match covers ``etag`` (weak comparison)."""
+    header = headers.get("If-None-Match") if headers is not None else None
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def accepted_encoding(headers):
+    """The best of ``ENCODINGS`` the request's Accept-Encoding allows, or None."""
+    header = headers.get("Accept-Encoding") if headers is not None else None
+    if not header:
+        return None
+    weights = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:].split(";")[0])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def encoded_etag(etag, encoding):
+    """The ETag of an encoded representation: weak, as byte-for-byte it differs."""
+    if etag is None or encoding is None or etag.startswith("W/"):
+        return etag
+    return "W/" + etag
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # wbits 31: gzip container around the deflate stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def parse_fields(value):
+    """Field names from ``"a,b"`` or ``["a", "b"]``; None (everything) when absent."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)) or not all(isinstance(field, str) for field in value):
+        raise ValueError("fields must be a comma-separated string or a list of names")
+    fields = tuple(dict.fromkeys(field.strip() for field in value if field.strip()))
+    return fields or None
+
+
+def project(payload, fields):
+    """Only ``fields`` of a prediction (plus ``ALWAYS_FIELDS``).
+
+    Batch responses keep their envelope and project each of their results.
+    """
+    if not fields or not isinstance(payload, dict):
+        return payload
+    if isinstance(payload.get("results"), list):
+        return dict(payload, results=[project(result, fields) for result in payload["results"]])
+    return {key: value for key, value in payload.items() if key in fields or key in ALWAYS_FIELDS}
+
+
+_bodies = OrderedDict()
+_bodies_lock = threading.Lock()
+
+
+def encode_body(payload, encoding, fields=None, key=None):
+    """``(body, encoding)`` for a payload; encoding is None when sent uncompressed.
+
+    With a ``key`` the result is cached: it must identify the payload, e.g.
+    the request URL and an ETag that carries the data version.
+    """
+    if key is not None:
+        key = key + (fields, encoding)
+        with _bodies_lock:
+            hit = _bodies.get(key)
+            if hit is not None:
+                _bodies.move_to_end(key)
+        telemetry.count("cache", f"body:{'hit' if hit is not None else 'miss'}")
+        if hit is not None:
+            return hit
+
+    with telemetry.stage("serialize"):
+        body = json.dumps(project(payload, fields)).encode()
+    if encoding is not None and len(body) >= MIN_COMPRESS_BYTES:
+        with telemetry.stage("compress"):
+            body = compress(body, encoding)
+    else:
+        encoding = None
+
+    if key is not None:
+        with _bodies_lock:
+            _bodies[key] = (body, encoding)
+            while len(_bodies) > MAX_CACHED_BODIES:
+                _bodies.popitem(last=False)
+    return body, encoding
+
+
+def send_server_timing(handler, status):
+    """Record ``status`` for the current request and report its stage timings so far."""
+    timings = telemetry.current_request()
+    if timings is not None:
+        timings.status = status
+        handler.send_header('Server-Timing', timings.server_timing())
+
+
+def send_not_modified(handler, etag, cache=None):
+    handler.send_response(304)
+    handler.send_header('ETag', encoded_etag(etag, accepted_encoding(handler.headers)))
+    handler.send_header('Vary', 'Accept-Encoding')
+    handler.send_header('Cache-Control', cache or cache_control())
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    send_server_timing(handler, 304)
+    handler.end_headers()
+
+
+def send_json(handler, payload, status=200, etag=None, cache=None, fields=None):
+    """Write ``payload`` as the response, compressed when the client accepts it.
+
+    With ``etag``, a matching If-None-Match is answered with 304 instead.
+    ``cache`` is the Cache-Control value; responses without one, and any
+    non-200 response, are sent with ``no-store``. ``fields`` projects the
+    payload (see ``project``); errors are always sent in full.
+    """
+    if status != 200:
+        etag, cache, fields = None, None, None
+    if etag is not None and etag_matches(handler.headers, etag):
+        send_not_modified(handler, etag, cache)
+        return
+
+    encoding = accepted_encoding(handler.headers)
+    # A GET's URL and data-versioned ETag pin down its body
+    key = (handler.path, etag) if etag is not None and getattr(handler, "command", None) == "GET" else None
+    body, body_encoding = encode_body(payload, encoding, fields, key)
+    handler.send_response(status)
+    handler.send_header('Content-type', 'application/json')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.send_header('Vary', 'Accept-Encoding')
+    if body_encoding is not None:
+        handler.send_header('Content-Encoding', body_encoding)
+    if etag is not None:
+        handler.send_header('ETag', encoded_etag(etag, encoding))
+    handler.send_header('Cache-Control', cache or NO_STORE)
+    handler.send_header('Content-Length', str(len(body)))
+    send_server_timing(handler, status)
+    handler.end_headers()
+    handler.wfile.write(body)
@@ -0,0 +1,215 @@
+"""Self-hosted server for every API route, with pre-forked workers.
+
+On Vercel each handler module is its own function. Here one process
+tree serves them all. The parent binds the socket, imports the handlers
+and maps the stats snapshot, then forks ``--workers`` children that
+accept from the same socket. The snapshot's columns and precomputed
+matrices stay in the shared mapping: workers read the same physical pages
+rather than holding copies, so memory does not grow with ``--workers``.
+When refresh.py publishes a new generation each worker maps it on its
+next request; the old one is unmapped once nothing uses it. Each
+worker serves HTTP/1.1 keep-alive connections on threads. CPU-bound work
+(matrix lookups, JSON encoding) runs in parallel across worker processes,
+so throughput scales with cores. Dead workers are replaced.
+
+    python api/serve.py --port 8000 --workers 4
+
+Routes (also under /api/...): /health, /metrics, /teams, /predict,
+/predict/batch, /predict/{type}/{team1}/{team2}, /simulate.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import index
+import predict
+import simulate
+from snapshot import open_snapshot
+
+DEFAULT_HOST = os.environ.get("PL_HOST", "0.0.0.0")
+DEFAULT_PORT = int(os.environ.get("PL_PORT", 8000))
+DEFAULT_WORKERS = int(os.environ.get("PL_WORKERS", os.cpu_count() or 1))
+# Idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = float(os.environ.get("PL_KEEPALIVE_TIMEOUT", 5))
+
+
+def resolve_route(path):
+    """(handler class, path as that handler expects it) for a request path, or None."""
+    route, _, query = path.partition("?")
+    if route.startswith("/api/") or route == "/api":
+        route = route[len("/api"):] or "/"
+
+    if route in ("/", "/health", "/metrics", "/teams", "/predict/batch"):
+        return index.handler, route if route != "/" else "/health"
+    if route == "/predict":
+        # Real-data predictions, GET with a query string or POST
+        return predict.handler, path
+    if route.startswith("/predict/"):
+        # index.py reads the type and teams from the 4th-6th path segments
+        return index.handler, "/predict/api/" + route[len("/predict/"):] + (f"?{query}" if query else "")
+    if route == "/simulate":
+        return simulate.handler, path
+    return None
+
+
+class Router(BaseHTTPRequestHandler):
+    """Dispatches each request on a keep-alive connection to the route's handler."""
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_OPTIONS(self):
+        self.dispatch()
+
+    def dispatch(self):
+        route = resolve_route(self.path)
+        method = f"do_{self.command}"
+        if route is None or not hasattr(route[0], method):
+            self.send_response(404)
+            self.send_header('Content-Length', '9')
+            self.end_headers()
+            self.wfile.write(b'Not Found')
+            return
+
+        handler_class, path = route
+        # The route's handler works on this connection's request, without re-parsing it
+        target = handler_class.__new__(handler_class)
+        target.__dict__.update(self.__dict__)
+        target.path = path
+        target.protocol_version = self.protocol_version
+        target.log_message = self.log_message
+        getattr(target, method)()
+        self.close_connection = target.close_connection
+
+    def log_message(self, format, *args):
+        # Requests are already logged as JSON lines by telemetry
+        pass
+
+
+class WorkerServer(ThreadingHTTPServer):
+    """Threaded HTTP server accepting on a socket bound by the parent."""
+    daemon_threads = True
+
+    def __init__(self, sock):
+        super().__init__(sock.getsockname()[:2], Router, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+
+
+def listen(host, port):
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def preload():
+    """Map the current snapshot in the parent so forked workers start ready.
+
+    Returns the snapshot (None before the first refresh). Its matrices are
+    attached, not computed, and cached per snapshot, so workers inherit them.
+    """
+    import predictor
+    from metrics import FBREF_METRICS, PASSING_METRICS
+
+    snapshot = open_snapshot()
+    if snapshot is None:
+        return None
+    warm = predictor.PremierLeaguePredictor()
+    for prediction_type in FBREF_METRICS:
+        warm._load_matchups(prediction_type)
+    for prediction_type in PASSING_METRICS:
+        predict.handler.get_matchup_matrix(snapshot, prediction_type)
+    return snapshot
+
+
+def run_worker(sock):
+    # The parent handles Ctrl-C and shuts workers down with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    WorkerServer(sock).serve_forever()
+
+
+def spawn(sock):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS):
+    sock = listen(host, port)
+    snapshot = preload()
+    if snapshot is None:
+        print("No stats snapshot yet; predictions use mock data until api/refresh.py runs")
+    else:
+        print(f"Preloaded snapshot {snapshot.version}")
+    if workers <= 1 or not hasattr(os, "fork"):
+        print(f"Serving on http://{host}:{port} (1 process)")
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            WorkerServer(sock).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    children = {spawn(sock) for _ in range(workers)}
+    print(f"Serving on http://{host}:{port} ({workers} workers)")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited ({status}), starting a new one")
+            time.sleep(0.1)
+            # Replacements start on the current generation, not the one at startup
+            preload()
+            children.add(spawn(sock))
+    return 0
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve every API route from pre-forked workers.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker processes (default: PL_WORKERS or the CPU count)")
+    args = parser.parse_args(argv)
+    return serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
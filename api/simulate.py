@@ -0,0 +1,281 @@
+"""Monte Carlo simulation of the rest of the season.
+
+The remaining fixtures are played ``runs`` times with goals drawn from the
+goal model's Poisson rates (independent home/away draws). Runs are split
+into fixed-size chunks of batched NumPy draws and spread over a process
+pool. Each chunk's seed is spawned from one SeedSequence, so results
+depend only on ``seed`` and ``runs``, not on the number of workers.
+
+The API answers in-process with at most ``MAX_API_RUNS`` runs; larger
+simulations and the process pool are for the command line.
+
+    python api/simulate.py --runs 100000 --seed 7
+    GET /api/simulate?runs=20000&seed=7
+"""
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+import time
+import threading
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from goal_model import GoalModel
+from matchups import cached_matrix
+from responses import cache_control, etag_matches, make_etag, send_json, send_not_modified
+from snapshot import open_snapshot
+
+DEFAULT_RUNS = int(os.environ.get("PL_SIM_RUNS", 100000))
+MAX_RUNS = int(os.environ.get("PL_SIM_MAX_RUNS", 1000000))
+DEFAULT_WORKERS = int(os.environ.get("PL_SIM_WORKERS", os.cpu_count() or 1))
+# Requests share a server, so the API runs far fewer seasons (about half a second)
+MAX_API_RUNS = int(os.environ.get("PL_SIM_MAX_API_RUNS", 20000))
+MAX_SEED = 2 ** 32 - 1
+# Seasons per batch of draws; bounds each worker's memory to a few tens of MB
+CHUNK_RUNS = 5000
+
+TOP_FOUR = 4
+RELEGATION_PLACES = 3
+
+
+class Season:
+    """The current table and remaining fixtures as arrays over every team."""
+
+    def __init__(self, model, played, remaining):
+        teams = set(model.teams)
+        for fixture in list(played) + list(remaining):
+            teams.update(fixture[:2])
+        self.teams = sorted(teams)
+        self.index = {team: i for i, team in enumerate(self.teams)}
+        n = len(self.teams)
+
+        self.points = np.zeros(n)
+        self.goals_for = np.zeros(n)
+        self.goals_against = np.zeros(n)
+        self.played = np.zeros(n, dtype=int)
+        for home, away, home_goals, away_goals in played:
+            h, a = self.index[home], self.index[away]
+            self.goals_for[h] += home_goals
+            self.goals_against[h] += away_goals
+            self.goals_for[a] += away_goals
+            self.goals_against[a] += home_goals
+            self.played[[h, a]] += 1
+            if home_goals > away_goals:
+                self.points[h] += 3
+            elif home_goals < away_goals:
+                self.points[a] += 3
+            else:
+                self.points[[h, a]] += 1
+
+        self.home = np.array([self.index[home] for home, _ in remaining], dtype=np.intp)
+        self.away = np.array([self.index[away] for _, away in remaining], dtype=np.intp)
+
+        # Teams the model has not seen play as an average side
+        attack = np.array([model.attack[model.index[t]] if t in model else 0.0 for t in self.teams])
+        defence = np.array([model.defence[model.index[t]] if t in model else 0.0 for t in self.teams])
+        self.home_rate = np.exp(model.intercept + model.home_advantage + attack[self.home] + defence[self.away])
+        self.away_rate = np.exp(model.intercept + attack[self.away] + defence[self.home])
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Built from the goal model and season stored by refresh.py; None if absent."""
+        model = GoalModel.from_meta(snapshot.meta.get("goal_model"))
+        season = snapshot.meta.get("season")
+        if model is None or not season:
+            return None
+        return cls(model, season["played"], season["remaining"])
+
+
+def simulate_chunk(season_arrays, runs, seed):
+    """Play the remaining fixtures ``runs`` times.
+
+    Returns (position counts [team, place], summed final points).
+    """
+    home_rate, away_rate, home, away, points, goals_for, goals_against = season_arrays
+    n, m = len(points), len(home)
+    rng = np.random.default_rng(seed)
+
+    # Fixture -> team incidence, so per-team totals are one matmul per stat
+    at_home = np.zeros((m, n))
+    at_home[np.arange(m), home] = 1
+    away_side = np.zeros((m, n))
+    away_side[np.arange(m), away] = 1
+
+    home_goals = rng.poisson(home_rate, size=(runs, m)).astype(float)
+    away_goals = rng.poisson(away_rate, size=(runs, m)).astype(float)
+    home_points = np.where(home_goals > away_goals, 3.0, np.where(home_goals == away_goals, 1.0, 0.0))
+    away_points = np.where(away_goals > home_goals, 3.0, np.where(home_goals == away_goals, 1.0, 0.0))
+
+    final_points = points + home_points @ at_home + away_points @ away_side
+    scored = goals_for + home_goals @ at_home + away_goals @ away_side
+    conceded = goals_against + away_goals @ at_home + home_goals @ away_side
+
+    # Points, then goal difference, then goals scored, then a coin toss
+    key = final_points * 1e6 + (scored - conceded + 1000) * 1e3 + scored + rng.random((runs, n))
+    table = np.argsort(-key, axis=1)
+    counts = np.bincount((table * n + np.arange(n)).ravel(), minlength=n * n).reshape(n, n)
+    return counts, final_points.sum(axis=0)
+
+
+def simulate(season, runs=DEFAULT_RUNS, seed=None, workers=DEFAULT_WORKERS):
+    """Simulate the rest of the season; returns the response dict (teams by expected points)."""
+    if not 1 <= runs <= MAX_RUNS:
+        raise ValueError(f"runs must be between 1 and {MAX_RUNS}")
+
+    sequence = np.random.SeedSequence(seed)
+    sizes = [CHUNK_RUNS] * (runs // CHUNK_RUNS) + ([runs % CHUNK_RUNS] if runs % CHUNK_RUNS else [])
+    seeds = sequence.spawn(len(sizes))
+    arrays = (season.home_rate, season.away_rate, season.home, season.away,
+              season.points, season.goals_for, season.goals_against)
+
+    started = time.perf_counter()
+    results = None
+    if workers > 1 and len(sizes) > 1:
+        # Deferred: multiprocessing is only needed once a simulation runs
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(sizes))) as pool:
+                results = list(pool.map(simulate_chunk, [arrays] * len(sizes), sizes, seeds))
+        except (OSError, NotImplementedError) as e:
+            # Some serverless sandboxes cannot start worker processes
+            print(f"Process pool unavailable ({e}), simulating in-process")
+    if results is None:
+        results = [simulate_chunk(arrays, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+
+    counts = sum(result[0] for result in results)
+    points = sum(result[1] for result in results)
+    places = np.arange(1, len(season.teams) + 1)
+
+    teams = [{
+        "team": team,
+        "points": int(season.points[i]),
+        "played": int(season.played[i]),
+        "expected_points": round(float(points[i] / runs), 1),
+        "expected_position": round(float(counts[i] @ places / runs), 2),
+        "title": round(float(counts[i, 0] / runs), 4),
+        "top_four": round(float(counts[i, :TOP_FOUR].sum() / runs), 4),
+        "relegation": round(float(counts[i, -RELEGATION_PLACES:].sum() / runs), 4),
+    } for i, team in enumerate(season.teams)]
+    teams.sort(key=lambda row: (-row["expected_points"], row["expected_position"]))
+
+    return {
+        "success": True,
+        "runs": runs,
+        "seed": sequence.entropy,
+        "fixtures_remaining": len(season.home),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "teams": teams
+    }
+
+
+_simulations = OrderedDict()
+_simulations_lock = threading.Lock()
+# Kept apart from the prediction matrices, so varying runs/seed can't evict them
+MAX_CACHED_SIMULATIONS = 4
+
+
+def simulate_snapshot(snapshot, runs=DEFAULT_RUNS, seed=None, workers=DEFAULT_WORKERS):
+    """Simulate from a stats snapshot; repeated identical requests reuse the result.
+
+    Without a ``seed`` one is derived from the snapshot version, so answers
+    are stable until the data changes.
+    """
+    season = cached_matrix("season", [snapshot], lambda: Season.from_snapshot(snapshot))
+    if season is None:
+        raise ValueError("No fitted season in the stats snapshot; run python api/refresh.py")
+    if seed is None:
+        seed = zlib.crc32(str(snapshot.version).encode("utf-8"))
+
+    key = (snapshot.version, runs, seed)
+    with _simulations_lock:
+        result = _simulations.get(key)
+        if result is not None:
+            _simulations.move_to_end(key)
+            return result
+
+    result = simulate(season, runs=runs, seed=seed, workers=workers)
+    with _simulations_lock:
+        _simulations[key] = result
+        while len(_simulations) > MAX_CACHED_SIMULATIONS:
+            _simulations.popitem(last=False)
+    return result
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        try:
+            query = parse_qs(urlparse(self.path).query)
+            runs = int(query.get('runs', [min(DEFAULT_RUNS, MAX_API_RUNS)])[0])
+            seed = int(query['seed'][0]) if 'seed' in query else None
+            if not 1 <= runs <= MAX_API_RUNS:
+                raise ValueError(f"runs must be between 1 and {MAX_API_RUNS}")
+            if seed is not None and not 0 <= seed <= MAX_SEED:
+                raise ValueError(f"seed must be between 0 and {MAX_SEED}")
+
+            snapshot = open_snapshot()
+            if snapshot is None:
+                raise ValueError("No stats snapshot available yet")
+
+            # Same snapshot, runs and seed give the same answer
+            etag = make_etag(snapshot.version, runs, seed)
+            if etag_matches(self.headers, etag):
+                send_not_modified(self, etag)
+                return
+            # In-process: forking a process pool from a threaded server
+            # (serve.py) can copy locks held by other threads into the children
+            result = simulate_snapshot(snapshot, runs=runs, seed=seed, workers=1)
+            send_json(self, result, etag=etag, cache=cache_control())
+
+        except ValueError as e:
+            send_json(self, {"success": False, "error": str(e)}, status=400)
+        except Exception as e:
+            send_json(self, {"success": False, "error": str(e)}, status=500)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate the rest of the season from the stats snapshot.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="seasons to simulate")
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed (default: random)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="worker processes")
+    parser.add_argument("--snapshot", default=None, help="snapshot path (default: PL_SNAPSHOT_PATH)")
+    parser.add_argument("--json", action="store_true", help="print the raw result")
+    args = parser.parse_args(argv)
+
+    snapshot = open_snapshot(args.snapshot, max_age=None)
+    season = Season.from_snapshot(snapshot) if snapshot is not None else None
+    if season is None:
+        print("No fitted season in the stats snapshot; run python api/refresh.py first")
+        return 1
+
+    result = simulate(season, runs=args.runs, seed=args.seed, workers=args.workers)
+    if args.json:
+        print(json.dumps(result))
+        return 0
+
+    print(f"{result['runs']} runs, {result['fixtures_remaining']} fixtures left, "
+          f"seed {result['seed']}, {result['elapsed_ms']:.0f} ms")
+    print(f"{'Team':<20}{'Pts':>5}{'xPts':>7}{'Title':>8}{'Top 4':>8}{'Rel.':>8}")
+    for row in result["teams"]:
+        print(f"{row['team']:<20}{row['points']:>5}{row['expected_points']:>7.1f}"
+              f"{row['title']:>8.1%}{row['top_four']:>8.1%}{row['relegation']:>8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
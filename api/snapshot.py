@@ -0,0 +1,386 @@
+"""Compact columnar on-disk format for team stats snapshots.
+
+Layout (all integers little-endian)::
+
+    b"PLSNAP1\n"             magic
+    uint32                  header length
+    header                  UTF-8 JSON: squads, column names/offsets, metadata
+    padding                 to an 8-byte boundary
+    float64[rows] * ncols   one contiguous block per numeric column
+    arrays                  precomputed n-d arrays, each 8-byte aligned
+
+Files are memory-mapped and columns and arrays exposed as zero-copy
+``memoryview`` objects, so answering from a snapshot needs neither HTML
+parsing nor pandas. The mapping is shared: every process that opens the
+same snapshot reads the same physical pages from the OS page cache (put
+PL_SNAPSHOT_PATH on /dev/shm to keep them in RAM), so memory does not grow
+with the number of workers.
+
+The refresher (refresh.py) publishes each snapshot under a versioned name
+and then atomically points ``team_stats.plsnap`` at it; handlers only ever
+open that path.
+"""
+import glob
+import hashlib
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import telemetry
+from cache import default_cache_dir
+
+MAGIC = b"PLSNAP1\n"
+_HEADER_LEN = struct.Struct("<I")
+_ALIGN = 8
+
+# Snapshots older than this are ignored (default: serve the latest, however old)
+MAX_SNAPSHOT_AGE = float(os.environ["PL_SNAPSHOT_MAX_AGE"]) if os.environ.get("PL_SNAPSHOT_MAX_AGE") else None
+# Published versions kept next to the current snapshot
+KEEP_VERSIONS = int(os.environ.get("PL_SNAPSHOT_KEEP", 5))
+
+
+# Built by CI and shipped with the deployment (vercel.json includeFiles);
+# read when no refresh job has published a snapshot on this machine
+BUNDLED_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     "data", "team_stats.plsnap")
+
+
+def default_snapshot_path():
+    return os.environ.get("PL_SNAPSHOT_PATH") or os.path.join(default_cache_dir(), "team_stats.plsnap")
+
+
+class Snapshot:
+    """Read-only view over a snapshot buffer (usually an mmap)."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a team stats snapshot")
+        try:
+            self._load(view)
+        except (TypeError, KeyError, IndexError, AttributeError, struct.error) as e:
+            # A truncated file or a bad header; callers only expect ValueError
+            raise ValueError(f"Corrupt snapshot: {e!r}") from e
+
+    def _load(self, view):
+        start = len(MAGIC) + _HEADER_LEN.size
+        (header_len,) = _HEADER_LEN.unpack_from(view, len(MAGIC))
+        header = json.loads(bytes(view[start:start + header_len]).decode("utf-8"))
+        if header.get("byteorder", "little") != sys.byteorder:
+            raise ValueError("Snapshot was written on a machine with a different byte order")
+
+        self.header = header
+        self.meta = header.get("meta", {})
+        self.version = header["version"]
+        self.created_at = header["created_at"]
+        self.squads = header["squads"]
+        self.integers = set(header.get("integers", ()))
+        self.index = {}
+        for i, squad in enumerate(self.squads):
+            self.index.setdefault(squad, i)
+        self._row_digests = {}
+
+        rows = len(self.squads)
+        data_start = _aligned(start + header_len)
+        # Only the column block is float64; the arrays after it have their own formats
+        column_end = data_start + 8 * rows * len(header["columns"])
+        if column_end > len(view):
+            raise ValueError("Snapshot is truncated")
+        floats = view[data_start:column_end].cast("d")
+        self._columns = {
+            name: floats[offset:offset + rows]
+            for name, offset in header["columns"].items()
+        }
+        raw = view[data_start:]
+        self._arrays = {
+            name: raw[spec["offset"]:spec["offset"] + spec["nbytes"]].cast(spec["format"], spec["shape"])
+            for name, spec in header.get("arrays", {}).items()
+        }
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __contains__(self, column):
+        return column in self._columns
+
+    def column(self, name):
+        """Zero-copy float64 view of a column, in squad order."""
+        return self._columns[name]
+
+    @property
+    def arrays(self):
+        return list(self._arrays)
+
+    def array(self, name):
+        """Zero-copy view of a precomputed array (``numpy.asarray`` wraps it read-only)."""
+        return self._arrays[name]
+
+    def value(self, squad, name):
+        """One value; ints for columns that only held whole numbers when written."""
+        value = self._columns[name][self.index[squad]]
+        if name in self.integers and not math.isnan(value):
+            return int(value)
+        return value
+
+    def row_digest(self, squad):
+        """Fingerprint of one squad's values; it survives new versions that leave the row alone."""
+        digest = self._row_digests.get(squad)
+        if digest is None:
+            i = self.index[squad]
+            h = hashlib.sha1()
+            for name in sorted(self._columns):
+                h.update(name.encode("utf-8"))
+                h.update(struct.pack("<d", self._columns[name][i]))
+            digest = self._row_digests[squad] = h.hexdigest()[:16]
+        return digest
+
+    def rows_version(self, squads, *parts):
+        """Data version of a response derived only from these squads' rows (and ``parts``).
+
+        Unlike ``version`` it stays the same across refreshes that change
+        other teams, so ETags and cached bodies of unaffected fixtures stay valid.
+        """
+        h = hashlib.sha1("\x1f".join(self.squads).encode("utf-8"))
+        for squad in squads:
+            h.update(self.row_digest(squad).encode("ascii"))
+        for part in parts:
+            h.update(b"\x1f" + str(part).encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def row(self, squad):
+        """All numeric values of one squad as a dict (NaN where missing)."""
+        return {name: self.value(squad, name) for name in self._columns}
+
+    def age(self):
+        return time.time() - self.created_at
+
+    def to_frame(self):
+        import pandas as pd
+
+        data = {"Squad": self.squads}
+        data.update({name: values.tolist() for name, values in self._columns.items()})
+        return pd.DataFrame(data)
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _as_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value
+
+
+def write_snapshot(path, squads, columns, meta=None, version=None, created_at=None, arrays=None):
+    """Atomically write a snapshot of ``{column: numeric sequence}`` for ``squads``.
+
+    ``arrays`` maps names to C-contiguous buffers (numpy arrays, ...) stored
+    as they are; empty ones are skipped. ``created_at`` is when the data was
+    fetched (defaults to now).
+    """
+    created_at = created_at if created_at is not None else time.time()
+    squads = [str(squad) for squad in squads]
+    rows = len(squads)
+
+    blocks = []
+    offsets = {}
+    integers = []
+    for name, values in columns.items():
+        block = array("d", (_as_float(v) for v in values))
+        if len(block) != rows:
+            raise ValueError(f"Column {name} has {len(block)} values for {rows} squads")
+        offsets[name] = len(blocks) * rows
+        blocks.append(block)
+        if all(math.isnan(v) or v.is_integer() for v in block):
+            integers.append(name)
+
+    extra = []
+    specs = {}
+    position = len(blocks) * rows * 8
+    for name, value in (arrays or {}).items():
+        view = memoryview(value)
+        if not view.c_contiguous:
+            raise ValueError(f"Array {name} is not C-contiguous")
+        if not view.nbytes:
+            continue
+        position = _aligned(position)
+        specs[name] = {"offset": position, "nbytes": view.nbytes, "format": view.format,
+                       "shape": list(view.shape)}
+        extra.append((position, view))
+        position += view.nbytes
+
+    header = json.dumps({
+        "version": version or f"{int(created_at * 1000):x}",
+        "created_at": created_at,
+        "byteorder": sys.byteorder,
+        "squads": squads,
+        "columns": offsets,
+        "integers": integers,
+        "arrays": specs,
+        "meta": meta or {},
+    }, separators=(",", ":")).encode("utf-8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+            data_start = f.tell()
+            for block in blocks:
+                block.tofile(f)
+            for offset, view in extra:
+                f.write(b"\0" * (data_start + offset - f.tell()))
+                f.write(view)
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def write_frame_snapshot(path, df, meta=None, version=None, created_at=None):
+    """Snapshot the numeric columns of a DataFrame with a ``Squad`` column."""
+    import pandas as pd
+
+    columns = {}
+    for name in df.columns:
+        if name == "Squad":
+            continue
+        values = pd.to_numeric(df[name], errors="coerce")
+        if values.notna().any():
+            columns[str(name)] = values.tolist()
+    return write_snapshot(path, df["Squad"].tolist(), columns, meta=meta, version=version,
+                          created_at=created_at)
+
+
+def changed_squads(snapshot, squads, columns):
+    """Squads whose values in ``columns`` differ from ``snapshot``'s, in order.
+
+    None when the two can't be compared row by row: no snapshot, or a
+    different squad list or set of columns.
+    """
+    if snapshot is None or list(snapshot.squads) != list(squads) or set(snapshot.columns) != set(columns):
+        return None
+    changed = []
+    for i, squad in enumerate(squads):
+        for name, values in columns.items():
+            old, new = snapshot.column(name)[i], _as_float(values[i])
+            if old != new and not (math.isnan(old) and math.isnan(new)):
+                changed.append(squad)
+                break
+    return changed
+
+
+def load_snapshot(path):
+    """Memory-map a snapshot file."""
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return Snapshot(buffer)
+
+
+_opened = {}
+_opened_lock = threading.Lock()
+
+
+def publish_snapshot(squads, columns, meta=None, path=None, created_at=None, keep=KEEP_VERSIONS,
+                     arrays=None):
+    """Write a new snapshot version and atomically make it the current one.
+
+    The data goes to ``<name>.<version>.plsnap`` beside ``path``; ``path``
+    is then replaced by a link to it, so readers see either the old or the
+    new version, never a mix. Only the newest ``keep`` versions are kept.
+    Returns the published version.
+    """
+    path = path or default_snapshot_path()
+    created_at = created_at if created_at is not None else time.time()
+    version = f"{int(time.time() * 1000):x}"
+    stem, ext = os.path.splitext(path)
+    versioned = f"{stem}.{version}{ext}"
+    write_snapshot(versioned, squads, columns, meta=meta, version=version, created_at=created_at,
+                   arrays=arrays)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.link(versioned, tmp_path)
+    except OSError:
+        # No hard links on this filesystem: fall back to a copy
+        shutil.copyfile(versioned, tmp_path)
+    os.replace(tmp_path, path)
+
+    old_versions = sorted(glob.glob(f"{glob.escape(stem)}.*{ext}"), key=os.path.getmtime, reverse=True)
+    for old in old_versions[max(keep, 1):]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return version
+
+
+def _open(path):
+    """The snapshot at ``path``, mapped once per file version; None if missing or unreadable."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    with _opened_lock:
+        cached = _opened.get(path)
+    if cached is not None and cached[0] == key:
+        telemetry.count("cache", "snapshot:hit")
+        return cached[1]
+
+    telemetry.count("cache", "snapshot:miss")
+    try:
+        with telemetry.stage("snapshot_load"):
+            snapshot = load_snapshot(path)
+    except (OSError, ValueError) as e:
+        # Remembered as None, so a bad file is reported once, not per request
+        print(f"Ignoring unreadable snapshot {path}: {e}")
+        snapshot = None
+    with _opened_lock:
+        _opened[path] = (key, snapshot)
+    return snapshot
+
+
+def open_snapshot(path=None, max_age=MAX_SNAPSHOT_AGE):
+    """The snapshot at ``path`` (default: PL_SNAPSHOT_PATH), or None if missing or too old.
+
+    Without a ``path``, falls back to the snapshot bundled with the
+    deployment when nothing readable has been published locally. The
+    mapping is reused across requests until the file is replaced.
+    """
+    candidates = [path] if path else [default_snapshot_path(), BUNDLED_SNAPSHOT_PATH]
+    for candidate in candidates:
+        snapshot = _open(candidate)
+        if snapshot is not None:
+            break
+    else:
+        return None
+
+    if max_age is not None and snapshot.age() > max_age:
+        return None
+    return snapshot
@@ -1,5 +1,15 @@
 from http.server import BaseHTTPRequestHandler
-import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from resolver import FALLBACK_TEAMS
+from responses import cache_control, make_etag, send_json
+
+# The list only changes with a deploy, so the edge can hold it for a day
+TEAMS_CACHE = cache_control(max_age=60 * 60, s_maxage=24 * 60 * 60, stale_while_revalidate=7 * 24 * 60 * 60)
+TEAMS_ETAG = make_etag("teams", *FALLBACK_TEAMS)
 
 
 class handler(BaseHTTPRequestHandler):
@@ -8,34 +18,18 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_GET(self):
         try:
             # Return fallback teams list
-            fallback_teams = [
-                'Arsenal', 'Aston Villa', 'Brighton', 'Burnley', 'Chelsea', 
-                'Crystal Palace', 'Everton', 'Fulham', 'Liverpool', 'Luton Town',
-                'Manchester City', 'Manchester Utd', 'Newcastle Utd', 'Nottingham Forest',
-                'Sheffield Utd', 'Tottenham', 'West Ham', 'Wolves', 'Bournemouth', 'Brentford'
-            ]
-            
-            result = {"success": True, "teams": fallback_teams}
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            result = {"success": True, "teams": FALLBACK_TEAMS}
+            send_json(self, result, etag=TEAMS_ETAG, cache=TEAMS_CACHE)
             
         except Exception as e:
             error_result = {
                 "success": False,
                 "error": str(e)
             }
-            
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(error_result).encode())
\ No newline at end of file
+            send_json(self, error_result, status=500)
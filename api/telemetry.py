@@ -0,0 +1,193 @@
+"""Stage timers, counters and the /metrics report.
+
+``stage(name)`` times a block. Its duration goes into a process-wide
+latency histogram and, inside a ``request(route)`` block, into that
+request's ``Server-Timing`` header and its one-line JSON log. ``count``
+tracks cache hits, fallbacks and upstream errors. Figures are per process;
+each serverless instance reports its own.
+
+Standard library only, so every endpoint can import it.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# One JSON line per request on stdout (PL_LOG_REQUESTS=0 to disable)
+LOG_REQUESTS = os.environ.get("PL_LOG_REQUESTS", "1") != "0"
+
+# Histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_lock = threading.Lock()
+_local = threading.local()
+_started_at = time.time()
+_histograms = {}
+_counters = {}
+
+
+class Histogram:
+    """Bucketed latencies (ms) with count and sum, like a Prometheus histogram."""
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms):
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (None past the last bound)."""
+        rank, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS_MS + (None,), self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def report(self):
+        cumulative, seen = {}, 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            cumulative[f"le_{bound}"] = seen
+        cumulative["le_inf"] = self.count
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class RequestTimings:
+    """Stage durations of the request being handled on this thread."""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.status = None
+        self.fallback = None
+
+    def add(self, name, ms):
+        # Repeated stages (one fetch per table, ...) add up
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        """``Server-Timing`` header value: each stage, then the total so far."""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+
+def observe(kind, name, ms):
+    with _lock:
+        histogram = _histograms.get((kind, name))
+        if histogram is None:
+            histogram = _histograms[(kind, name)] = Histogram()
+        histogram.observe(ms)
+
+
+def count(group, name, n=1):
+    """Add ``n`` to counter ``name`` of ``group``, e.g. ``count("cache", "predictor:hit")``."""
+    with _lock:
+        key = (group, name)
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def fallback(name):
+    """Count a degraded answer; it is also noted in the request's log line."""
+    count("fallback", name)
+    current = current_request()
+    if current is not None:
+        current.fallback = name
+
+
+@contextmanager
+def stage(name):
+    """Time the block as stage ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        observe("stage", name, ms)
+        current = current_request()
+        if current is not None:
+            current.add(name, ms)
+
+
+def current_request():
+    return getattr(_local, "request", None)
+
+
+@contextmanager
+def request(route):
+    """Track one request on this thread; records and logs it when the block ends."""
+    timings = RequestTimings(route)
+    _local.request = timings
+    try:
+        yield timings
+    finally:
+        _local.request = None
+        ms = timings.elapsed_ms()
+        observe("route", route, ms)
+        status = f"{timings.status // 100}xx" if timings.status else "unknown"
+        count("responses", f"{route}:{status}")
+        if LOG_REQUESTS:
+            print(json.dumps({
+                "event": "request",
+                "route": route,
+                "status": timings.status,
+                "ms": round(ms, 2),
+                "stages": {name: round(value, 2) for name, value in timings.stages.items()},
+                "fallback": timings.fallback,
+            }))
+
+
+def _outcomes(counters, group):
+    """``{prefix: {outcome: n}}`` for the group's counters named ``prefix:outcome``."""
+    result = {}
+    for (counter_group, name), n in counters.items():
+        if counter_group == group and ":" in name:
+            prefix, outcome = name.rsplit(":", 1)
+            result.setdefault(prefix, {})[outcome] = n
+    return result
+
+
+def _with_rate(outcomes, rate_name, counted):
+    """Adds ``rate_name``: the share of ``counted`` outcomes in each entry."""
+    for counts in outcomes.values():
+        total = sum(counts.values())
+        counts[rate_name] = round(sum(counts.get(o, 0) for o in counted) / total, 4) if total else None
+    return outcomes
+
+
+def report():
+    """Everything recorded by this process, for /metrics."""
+    with _lock:
+        histograms = {key: histogram.report() for key, histogram in _histograms.items()}
+        counters = dict(_counters)
+
+    return {
+        "uptime_s": round(time.time() - _started_at, 1),
+        "pid": os.getpid(),
+        "requests": {name: value for (kind, name), value in histograms.items() if kind == "route"},
+        "responses": _outcomes(counters, "responses"),
+        "stages": {name: value for (kind, name), value in histograms.items() if kind == "stage"},
+        # Stale entries are served immediately too, so they count as hits
+        "caches": _with_rate(_outcomes(counters, "cache"), "hit_rate", ("hit", "stale")),
+        "fallbacks": {name: n for (group, name), n in counters.items() if group == "fallback"},
+        "upstream": _with_rate(_outcomes(counters, "upstream"), "error_rate", ("error",)),
+    }
@@ -0,0 +1,204 @@
+"""FBref stand-in for offline benchmarks: recorded-layout pages and a local server.
+
+Pages reproduce the markup the scrapers depend on (two-row headers with
+``over_header`` groups, ``stats_squads_*_for`` tables, the ``_against``
+table shipped inside an HTML comment, thousands separators, en-dash
+scores) and roughly the size of the real pages. Values come from a fixed
+seed, so every run parses exactly the same data.
+
+    python benchmarks/fbref_fixtures.py --port 8765   # serve until Ctrl-C
+    PL_FBREF_BASE_URL=http://127.0.0.1:8765 python api/refresh.py
+"""
+import hashlib
+import random
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SQUADS = [
+    "Arsenal", "Aston Villa", "Bournemouth", "Brentford", "Brighton", "Chelsea",
+    "Crystal Palace", "Everton", "Fulham", "Ipswich Town", "Leicester City", "Liverpool",
+    "Manchester City", "Manchester Utd", "Newcastle Utd", "Nott'ham Forest",
+    "Southampton", "Tottenham", "West Ham", "Wolves",
+]
+
+# Column groups of each squad table, as (over-header, [labels])
+LAYOUTS = {
+    "passing": [
+        ("", ["Squad", "# Pl", "90s"]),
+        ("Total", ["Cmp", "Att", "Cmp%", "TotDist", "PrgDist"]),
+        ("Short", ["Cmp", "Att", "Cmp%"]),
+        ("Medium", ["Cmp", "Att", "Cmp%"]),
+        ("Long", ["Cmp", "Att", "Cmp%"]),
+        ("", ["Ast", "xAG"]),
+        ("Expected", ["xA", "A-xAG"]),
+        ("", ["KP", "1/3", "PPA", "CrsPA", "PrgP"]),
+    ],
+    "defense": [
+        ("", ["Squad", "# Pl", "90s"]),
+        ("Tackles", ["Tkl", "TklW", "Def 3rd", "Mid 3rd", "Att 3rd"]),
+        ("Challenges", ["Tkl", "Att", "Tkl%", "Lost"]),
+        ("Blocks", ["Blocks", "Sh", "Pass"]),
+        ("", ["Int", "Tkl+Int", "Clr", "Err"]),
+    ],
+    "keepers": [
+        ("", ["Squad", "# Pl"]),
+        ("Playing Time", ["MP", "Starts", "Min", "90s"]),
+        ("Performance", ["GA", "GA90", "SoTA", "Saves", "Save%", "W", "D", "L", "CS", "CS%"]),
+        ("Penalty Kicks", ["PKatt", "PKsv", "PKm", "Save%"]),
+    ],
+}
+
+STATS_PATH = "/en/comps/9/{kind}/Premier-League-Stats"
+SCHEDULE_PATH = "/en/comps/9/schedule/Premier-League-Scores-and-Fixtures"
+
+# Navigation, scripts and ads around the tables; real pages are mostly this
+_FILLER_BLOCK = ('<div class="section_wrapper"><ul class="nav">'
+                 + "".join(f'<li><a href="/en/squads/{i:08x}/">Link {i}</a></li>' for i in range(40))
+                 + '</ul><script>window.dataLayer=window.dataLayer||[];</script></div>\n')
+FILLER_BLOCKS = 120
+
+
+def _value(label, rng):
+    if "%" in label:
+        return f"{rng.uniform(50, 90):.1f}"
+    if label in ("90s", "xAG", "xA", "A-xAG", "GA90"):
+        return f"{rng.uniform(0, 40):.1f}"
+    return f"{rng.randint(0, 20000):,}"
+
+
+def squad_table(kind, table_id, seed, changed=()):
+    """One squad table; the ``changed`` squads get other values, as after a matchday."""
+    layout = LAYOUTS[kind]
+    over = "".join(
+        f'<th aria-label="" data-stat="header_{group.lower()}" colspan="{len(labels)}" '
+        f'class=" over_header center">{group}</th>'
+        for group, labels in layout)
+    labels = [label for _, group_labels in layout for label in group_labels]
+    header = "".join(
+        f'<th aria-label="{label}" data-stat="c{i}" scope="col" class=" poptip center">{label}</th>'
+        for i, label in enumerate(labels))
+
+    rows = []
+    for squad in SQUADS:
+        rng = random.Random(f"{table_id}:{seed}:{squad}:{squad in changed}")
+        cells = [
+            f'<th scope="row" class="left " data-stat="team"><a href="/en/squads/x/{squad}-Stats">{squad}</a></th>'
+            if label == "Squad" else f'<td class="right " data-stat="c{i}">{_value(label, rng)}</td>'
+            for i, label in enumerate(labels)]
+        rows.append("<tr >" + "".join(cells) + "</tr>")
+
+    return (f'<table class="stats_table sortable min_width" id="{table_id}" data-cols-to-freeze=",1">'
+            f'<caption>Squad Standard Stats Table</caption><colgroup></colgroup>'
+            f'<thead><tr class="over_header">{over}</tr><tr>{header}</tr></thead>'
+            f'<tbody>{"".join(rows)}</tbody></table>')
+
+
+def _page(title, body):
+    filler = _FILLER_BLOCK * (FILLER_BLOCKS // 2)
+    return (f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title}</title></head>'
+            f'<body><div id="header">{filler}</div><div id="content">{body}</div>'
+            f'<div id="footer">{filler}</div></body></html>')
+
+
+def stats_page(kind, seed=1, changed=()):
+    wanted = squad_table(kind, f"stats_squads_{kind}_for", seed, changed)
+    against = squad_table(kind, f"stats_squads_{kind}_against", seed, changed)
+    body = (f'<div class="table_wrapper"><div class="table_container" id="div_stats_squads_{kind}_for">'
+            f'{wanted}</div></div>'
+            f'<div class="table_wrapper"><div class="placeholder"></div><!--\n'
+            f'<div class="table_container" id="div_stats_squads_{kind}_against">{against}</div>\n--></div>')
+    return _page(f"2024-2025 Premier League {kind.title()} Stats | FBref.com", body)
+
+
+def schedule_page(seed=1, played_share=0.6):
+    """Every fixture of the season; about ``played_share`` of them with a score."""
+    rng = random.Random(f"schedule:{seed}")
+    columns = ["Wk", "Day", "Date", "Time", "Home", "xG", "Score", "xG", "Away",
+               "Attendance", "Venue", "Referee", "Match Report", "Notes"]
+    rows = []
+    for week, home in enumerate(SQUADS, start=1):
+        for away in SQUADS:
+            if home == away:
+                continue
+            score = f"{rng.randint(0, 4)}–{rng.randint(0, 3)}" if rng.random() < played_share else ""
+            rows.append(
+                f'<tr><th data-stat="gameweek">{week}</th><td>Sat</td><td>2024-08-{week + 10}</td>'
+                f'<td>15:00</td><td><a>{home}</a></td><td>1.2</td><td><a>{score}</a></td><td>0.9</td>'
+                f'<td><a>{away}</a></td><td>60,000</td><td>Stadium</td><td>Referee</td>'
+                f'<td>Match Report</td><td></td></tr>')
+        if week % 5 == 0:
+            rows.append('<tr class="spacer partial_table result_all"><td colspan="14"></td></tr>')
+    header = "".join(f"<th>{column}</th>" for column in columns)
+    table = (f'<table class="stats_table sortable min_width" id="sched_2024-2025_9_1">'
+             f'<caption>Scores &amp; Fixtures Table</caption><thead><tr>{header}</tr></thead>'
+             f'<tbody>{"".join(rows)}</tbody></table>')
+    return _page("2024-2025 Premier League Scores & Fixtures | FBref.com", table)
+
+
+def pages(seed=1, changed=()):
+    """URL path -> UTF-8 page body for every page the scrapers request.
+
+    Only the ``changed`` squads' stats differ from the pages without them.
+    """
+    result = {STATS_PATH.format(kind=kind): stats_page(kind, seed, changed).encode("utf-8")
+              for kind in LAYOUTS}
+    result[SCHEDULE_PATH] = schedule_page(seed).encode("utf-8")
+    return result
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves ``server.pages`` with keep-alive and ETag revalidation, like FBref."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.server.pages.get(self.path.split("?")[0])
+        if body is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, seed=1):
+    """Start the stand-in on a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInHandler)
+    server.daemon_threads = True
+    server.pages = pages(seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve recorded-layout FBref pages locally.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.seed)
+    print(f"Serving FBref stand-in at {base_url} (PL_FBREF_BASE_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
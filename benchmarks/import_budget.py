@@ -0,0 +1,106 @@
+"""Cold-import budget check for the serverless endpoints.
+
+Each scenario runs in a fresh interpreter, so it measures what a cold
+function instance pays before it can answer. A scenario fails when it
+exceeds its time budget or imports a module outside its dependency set.
+
+    python benchmarks/import_budget.py            # exit status 1 on failure
+    PL_IMPORT_BUDGET_SCALE=2 python benchmarks/import_budget.py
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+SCALE = float(os.environ.get("PL_IMPORT_BUDGET_SCALE", 1))
+RUNS = int(os.environ.get("PL_IMPORT_BUDGET_RUNS", 5))
+
+# Heavy modules no lightweight endpoint may pull in
+HEAVY = ["pandas", "requests", "bs4", "selenium", "lxml"]
+
+# A GET through index.py's handler, answered from the fixture snapshot
+INDEX_GET = (
+    "import io, index\n"
+    "h = index.handler.__new__(index.handler)\n"
+    "h.path, h.headers, h.wfile = {path!r}, {{}}, io.BytesIO()\n"
+    "h.request_version, h.requestline, h.command = 'HTTP/1.1', 'GET {path}', 'GET'\n"
+    "h.client_address = ('127.0.0.1', 0)\n"
+    "h.log_message = lambda *args: None\n"
+    "h.do_GET()\n"
+    "assert b' 200 ' in h.wfile.getvalue().split(b'\\r\\n')[0], h.wfile.getvalue()\n"
+    "assert b'\"success\": true' in h.wfile.getvalue(), h.wfile.getvalue()\n"
+)
+
+# name -> (code run after the timer starts, budget in ms, forbidden modules)
+SCENARIOS = {
+    "teams": ("import teams", 80, HEAVY + ["numpy"]),
+    "index (/health)": ("import index", 80, HEAVY + ["numpy"]),
+    "predict (import)": ("import predict", 200, HEAVY),
+    "simulate (import)": ("import simulate", 200, HEAVY),
+    "index (/teams)": (INDEX_GET.format(path="/teams"), 80, HEAVY + ["numpy"]),
+    "index (/predict/{type})": (INDEX_GET.format(path="/predict/api/advanced/Arsenal/Chelsea"), 160, HEAVY),
+    "predict (cached snapshot)": (
+        "import predict\n"
+        "h = predict.handler.__new__(predict.handler)\n"
+        "r = h.create_prediction_with_real_data('Arsenal', 'Chelsea', 'advanced')\n"
+        "assert r['disclaimer'].startswith('Prediction based on'), r\n",
+        160, HEAVY,
+    ),
+}
+
+RUNNER = """
+import json, sys, time
+sys.path.insert(0, {api_dir!r})
+start = time.perf_counter()
+exec(compile({code!r}, "<scenario>", "exec"))
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def write_fixture_snapshot(path):
+    sys.path.insert(0, API_DIR)
+    from snapshot import write_snapshot
+
+    squads = ["Arsenal", "Chelsea", "Liverpool"]
+    write_snapshot(path, squads, {
+        "Passing_Accuracy": [84.1, 82.3, 80.9],
+        "Progressive_Passes": [612, 540, 655],
+        "Assists": [21, 17, 25],
+    }, meta={"source": "import_budget fixture"})
+
+
+def run_scenario(code, env):
+    script = RUNNER.format(api_dir=API_DIR, code=code)
+    out = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PL_CACHE_DIR=tmp,
+                   PL_SNAPSHOT_PATH=os.path.join(tmp, "team_stats.plsnap"))
+        write_fixture_snapshot(env["PL_SNAPSHOT_PATH"])
+
+        for name, (code, budget, forbidden) in SCENARIOS.items():
+            runs = [run_scenario(code, env) for _ in range(RUNS)]
+            best = min(run["ms"] for run in runs)
+            loaded = {m.split(".")[0] for m in runs[0]["modules"]}
+            leaked = [m for m in forbidden if m in loaded]
+            limit = budget * SCALE
+
+            ok = best <= limit and not leaked
+            failed |= not ok
+            status = "ok  " if ok else "FAIL"
+            extra = f"  imports {', '.join(leaked)}" if leaked else ""
+            print(f"{status} {name:<28} {best:7.1f} ms (budget {limit:.0f} ms){extra}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Offline benchmarks of the prediction pipeline, stage by stage.
+
+FBref is replaced by the local stand-in from fbref_fixtures.py, so runs
+need no network and always see the same pages. Each stage is timed on its
+own (fetch, table parse, column flattening, squad join, metric
+comparison, attaching a precomputed matrix from the snapshot, JSON
+serialization, gzip), followed by the end-to-end paths:
+``basic_prediction``, ``advanced_prediction``, the /api/predict handler
+and refresh runs (unchanged data, and two squads changed).
+
+Medians are compared against a saved baseline; a stage is flagged when it
+is more than PL_BENCH_TOLERANCE (default 25%) and PL_BENCH_MIN_DELTA_MS
+(default 0.1 ms) slower, and still is when measured again.
+
+    python benchmarks/pipeline.py --save   # record the baseline
+    python benchmarks/pipeline.py          # exit status 1 on a regression
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BENCH_DIR), "api")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+RUNS = int(os.environ.get("PL_BENCH_RUNS", 30))
+WARMUP = 3
+TOLERANCE = float(os.environ.get("PL_BENCH_TOLERANCE", 0.25))
+MIN_DELTA_MS = float(os.environ.get("PL_BENCH_MIN_DELTA_MS", 0.1))
+
+FIXTURE = ("Arsenal", "Chelsea")
+# Squads in the synthetic matrix timed next to the real 20
+LARGE_SQUADS = 200
+
+
+def measure(fn, runs=RUNS):
+    """Median and 95th percentile of ``fn()`` in milliseconds."""
+    for _ in range(WARMUP):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+    }
+
+
+def quietly(fn):
+    """``fn`` with its progress prints swallowed."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def build_stages(tmp, server):
+    """Stage name -> zero-argument callable, in pipeline order.
+
+    Modules are imported here, after the environment points them at the
+    stand-in ``server`` and a scratch cache directory.
+    """
+    from http.server import ThreadingHTTPServer
+    import http.client
+    import threading
+    from urllib.parse import quote
+
+    import numpy as np
+    from lxml import html as lxml_html
+
+    import extract
+    import fbref_fixtures
+    import predict
+    import refresh
+    import responses
+    from cache import TableCache
+    from fetcher import FBrefFetcher
+    from matchups import MatchupMatrix, snapshot_matrix
+    from metrics import FBREF_METRICS
+    from predictor import PremierLeaguePredictor
+    from snapshot import open_snapshot
+
+    fetcher = FBrefFetcher(validators=TableCache("bench-http", cache_dir=tmp))
+    predictor = PremierLeaguePredictor(cache=TableCache("bench", cache_dir=tmp), http=fetcher)
+    urls = list(predictor.source_urls().values())
+    advanced = FBREF_METRICS["advanced"]
+
+    # Publish a snapshot once, as the refresh job would, for the request paths
+    quietly(lambda: refresh.refresh())()
+    snapshot = open_snapshot()
+
+    pages = [fetcher.fetch_http(url).html for url in urls]
+    fragments = [extract.find_table_html(page, match="Squad") for page in pages]
+    headers = [list(lxml_html.fragment_fromstring(fragment).find("thead").iter("tr")) for fragment in fragments]
+    tables = [extract.parse_table(fragment) for fragment in fragments]
+    merged = predictor.merge_tables(*tables)
+    matrix = MatchupMatrix.from_frame(merged, advanced.columns, skip_missing=True,
+                                      directions=advanced.directions, weights=advanced.weights)
+    result = predictor.advanced_prediction(list(FIXTURE))
+    assert result["success"], result
+
+    def fetch():
+        for url in urls:
+            fetcher.validators.invalidate(url)
+            fetcher.fetch_http(url)
+
+    def revalidate():
+        for url in urls:
+            assert fetcher.fetch_http(url).not_modified
+
+    matchdays = [server.pages, fbref_fixtures.pages(changed=FIXTURE)]
+
+    # The matrix step of a refresh on its own, without the fetch and parse
+    columns = {name: snapshot.column(name) for name in snapshot.columns}
+
+    def precompute(changed=None):
+        return lambda: refresh.build_arrays(snapshot.squads, columns, previous=snapshot, changed=changed)
+
+    # ...and on a larger squad list, where the partial recompute pays off
+    rng = np.random.default_rng(0)
+    many = [f"Squad {i}" for i in range(LARGE_SQUADS)]
+    many_columns = {m: rng.normal(size=LARGE_SQUADS).round(2) for m in advanced.columns}
+    large = MatchupMatrix.from_columns(many, many_columns, skip_missing=True,
+                                       directions=advanced.directions, weights=advanced.weights)
+
+    def refresh_changed():
+        # Alternate between two pages that differ in two squads' rows
+        matchdays.reverse()
+        server.pages = matchdays[0]
+        quietly(lambda: refresh.refresh())()
+
+    def flatten():
+        for rows in headers:
+            # Uncached, as on the first parse of a layout
+            extract.compile_schema.__wrapped__(extract._header_signature(rows))
+
+    class QuietHandler(predict.handler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), QuietHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    query = f"/api/predict?team1={quote(FIXTURE[0])}&team2={quote(FIXTURE[1])}&prediction_type=advanced"
+    body = json.dumps({"team1": FIXTURE[0], "team2": FIXTURE[1], "prediction_type": "advanced"})
+
+    def request(method, path, payload=None):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        headers = {"Content-Type": "application/json"} if payload else {}
+        connection.request(method, path, body=payload, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        connection.close()
+        assert response.status == 200, data
+        return data
+
+    return {
+        "fetch": fetch,
+        "revalidate (304)": revalidate,
+        "find table": lambda: [extract.find_table_html(page, match="Squad") for page in pages],
+        "parse table": lambda: [extract.parse_table(fragment) for fragment in fragments],
+        "flatten columns": flatten,
+        "merge_and_filter": lambda: predictor.merge_and_filter(
+            list(FIXTURE), *tables, columns=advanced.summary + advanced.columns),
+        "merge all": lambda: predictor.merge_tables(*tables),
+        "compare (build matrix)": lambda: MatchupMatrix.from_frame(
+            merged, advanced.columns, skip_missing=True,
+            directions=advanced.directions, weights=advanced.weights),
+        "compare (attach matrix)": lambda: snapshot_matrix(snapshot, advanced, skip_missing=True),
+        "compare (lookup)": lambda: matrix.lookup(*FIXTURE),
+        "serialize": lambda: json.dumps(result),
+        "compress (gzip)": lambda: responses.compress(json.dumps(result).encode(), "gzip"),
+        "basic_prediction": lambda: predictor.basic_prediction(list(FIXTURE)),
+        "advanced_prediction": lambda: predictor.advanced_prediction(list(FIXTURE)),
+        "predict.py GET": lambda: request("GET", query),
+        "predict.py POST": lambda: request("POST", "/api/predict", body),
+        "refresh": quietly(lambda: refresh.refresh()),
+        "refresh (2 squads changed)": refresh_changed,
+        "matrices (full rebuild)": precompute(),
+        "matrices (2 squads changed)": precompute(changed=FIXTURE),
+        f"matrix ({LARGE_SQUADS} squads, full)": lambda: MatchupMatrix.from_columns(
+            many, many_columns, skip_missing=True,
+            directions=advanced.directions, weights=advanced.weights),
+        f"matrix ({LARGE_SQUADS} squads, 2 changed)": lambda: large.updated(large.values, [0, 1]),
+    }
+
+
+def is_slower(timing, base):
+    median, expected = timing["median_ms"], base["median_ms"]
+    return median > expected * (1 + TOLERANCE) and median - expected > MIN_DELTA_MS
+
+
+def compare(results, baseline):
+    """Print one line per stage; returns the names of regressed stages."""
+    regressed = []
+    for name, timing in results.items():
+        base = baseline.get(name)
+        median = timing["median_ms"]
+        line = f"{name:<24} {median:9.3f} ms  p95 {timing['p95_ms']:9.3f} ms"
+        if base is None:
+            print(f"new  {line}")
+            continue
+        change = median / base["median_ms"] - 1 if base["median_ms"] else 0.0
+        slow = is_slower(timing, base)
+        if slow:
+            regressed.append(name)
+        print(f"{'SLOW' if slow else 'ok  '} {line}  (baseline {base['median_ms']:.3f} ms, {change:+.0%})")
+    return regressed
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the prediction pipeline offline.")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--runs", type=int, default=RUNS, help="timed runs per stage")
+    parser.add_argument("--only", default=None, help="only stages whose name contains this")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, BENCH_DIR)
+    from fbref_fixtures import start_server
+
+    server, base_url = start_server()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(PL_FBREF_BASE_URL=base_url, PL_CACHE_DIR=tmp, PL_LOG_REQUESTS="0",
+                          PL_SNAPSHOT_PATH=os.path.join(tmp, "team_stats.plsnap"))
+        sys.path.insert(0, API_DIR)
+        stages = build_stages(tmp, server)
+        stages = {name: fn for name, fn in stages.items() if args.only is None or args.only in name}
+        results = {name: measure(fn, args.runs) for name, fn in stages.items()}
+
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get("stages", {})
+        # A noisy neighbour can slow one pass; only flag stages that stay slow
+        for name, timing in results.items():
+            if name in baseline and is_slower(timing, baseline[name]):
+                retry = measure(stages[name], args.runs)
+                if retry["median_ms"] < timing["median_ms"]:
+                    results[name] = retry
+    server.shutdown()
+
+    regressed = compare(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "runs": args.runs,
+                "stages": dict(baseline, **results),
+            }, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if regressed:
+        print(f"Regressed: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
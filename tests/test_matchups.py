@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from matchups import MatchupMatrix
+
+SQUADS = [f"Squad {i}" for i in range(12)]
+METRICS = ["Gls", "Ast", "xG", "Cards"]
+DIRECTIONS = {"Cards": -1}
+
+
+def random_columns(rng, integers=False, missing=0.0):
+    columns = {}
+    for metric in METRICS:
+        if integers:
+            # Few distinct values, so plenty of tied metrics
+            columns[metric] = rng.integers(0, 4, len(SQUADS))
+        else:
+            values = rng.normal(size=len(SQUADS)).round(1)
+            values[rng.random(len(SQUADS)) < missing] = np.nan
+            columns[metric] = values
+    return columns
+
+
+def change_rows(rng, columns, rows, integers=False):
+    changed = {}
+    for metric, values in columns.items():
+        values = values.copy()
+        for row in rows:
+            if integers:
+                values[row] = rng.integers(0, 4)
+            else:
+                values[row] = np.nan if rng.random() < 0.2 else round(rng.normal(), 1)
+        changed[metric] = values
+    return changed
+
+
+def assert_same_matrix(actual, expected):
+    for name in MatchupMatrix.ARRAYS:
+        a, b = getattr(actual, name), getattr(expected, name)
+        assert a.dtype == b.dtype, name
+        np.testing.assert_array_equal(a, b, err_msg=name)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("options", [
+    {},
+    {"skip_missing": True},
+    {"fill_value": 0.0},
+    {"fill_value": 0.0, "skip_missing": True},
+])
+@pytest.mark.parametrize("weights", [None, {"Gls": 2, "xG": 3}, {"Gls": 1.5, "Cards": 0.5}])
+@pytest.mark.parametrize("integers", [False, True])
+def test_updated_matches_a_full_rebuild(seed, options, weights, integers):
+    rng = np.random.default_rng(seed)
+    before = random_columns(rng, integers=integers, missing=0.25)
+    rows = sorted(rng.choice(len(SQUADS), size=int(rng.integers(1, 4)), replace=False).tolist())
+    after = change_rows(rng, before, rows, integers=integers)
+    fill_value = options.get("fill_value")
+
+    kwargs = dict(options, directions=DIRECTIONS, weights=weights)
+    previous = MatchupMatrix.from_columns(SQUADS, before, **kwargs)
+    expected = MatchupMatrix.from_columns(SQUADS, after, **kwargs)
+
+    values = MatchupMatrix.from_columns(SQUADS, after, fill_value=fill_value).values
+    assert_same_matrix(previous.updated(values, rows), expected)
+
+    # As the refresher does it: from the arrays stored in the last snapshot
+    stored = MatchupMatrix.from_arrays(SQUADS, METRICS, previous.arrays(),
+                                       skip_missing=options.get("skip_missing", False),
+                                       directions=DIRECTIONS, weights=weights)
+    assert_same_matrix(stored.updated(values, rows), expected)
+
+
+def test_updated_leaves_the_original_untouched():
+    rng = np.random.default_rng(0)
+    before = random_columns(rng)
+    previous = MatchupMatrix.from_columns(SQUADS, before)
+    arrays = {name: array.copy() for name, array in previous.arrays().items()}
+
+    after = change_rows(rng, before, [0, 5])
+    previous.updated(MatchupMatrix.from_columns(SQUADS, after).values, [0, 5])
+    for name, array in arrays.items():
+        np.testing.assert_array_equal(getattr(previous, name), array, err_msg=name)
+
+
+def test_updated_without_changed_rows_is_a_copy():
+    rng = np.random.default_rng(1)
+    previous = MatchupMatrix.from_columns(SQUADS, random_columns(rng))
+    assert_same_matrix(previous.updated(previous.values, []), previous)
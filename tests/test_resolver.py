@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from resolver import FALLBACK_TEAMS, resolver_for
+
+
+@pytest.fixture
+def resolver():
+    return resolver_for(FALLBACK_TEAMS)
+
+
+@pytest.mark.parametrize("name, squad", [
+    ("Arsenal", "Arsenal"),
+    ("man city", "Manchester City"),
+    ("Manchester United FC", "Manchester Utd"),
+    ("Nottingham Forest", "Nott'ham Forest"),
+    ("Nottingham", "Nott'ham Forest"),
+    ("spurs", "Tottenham"),
+    ("Hotspur", "Tottenham"),
+    ("Tottenham Hotspur FC", "Tottenham"),
+    ("Brighton & Hove Albion", "Brighton"),
+    ("Wolverhampton Wanderers", "Wolves"),
+    ("Liverpol", "Liverpool"),
+    ("Arsenel", "Arsenal"),
+])
+def test_resolves_league_squads(resolver, name, squad):
+    assert resolver.resolve(name) == squad
+
+
+@pytest.mark.parametrize("name", [
+    # Clubs outside the league
+    "Southampton",
+    "West Brom",
+    "Sheffield Wednesday",
+    "Leeds",
+    # Names shared by several squads
+    "United",
+    "Manchester",
+    "Utd",
+])
+def test_unknown_or_ambiguous_names_resolve_to_none(resolver, name):
+    assert resolver.resolve(name) is None
+
+
+def test_aliases_of_other_leagues_squads_resolve_once_they_play(resolver):
+    assert resolver.resolve("saints") is None
+    assert resolver_for(FALLBACK_TEAMS + ["Southampton"]).resolve("saints") == "Southampton"
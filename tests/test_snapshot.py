@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import snapshot
+from snapshot import load_snapshot, open_snapshot, write_snapshot
+
+
+def write(path, squads):
+    write_snapshot(str(path), squads, {"Gls": [float(i) for i in range(len(squads))]})
+
+
+def test_falls_back_to_the_bundled_snapshot(tmp_path, monkeypatch):
+    bundled = tmp_path / "bundle" / "team_stats.plsnap"
+    write(bundled, ["Arsenal", "Chelsea"])
+    monkeypatch.setattr(snapshot, "BUNDLED_SNAPSHOT_PATH", str(bundled))
+    monkeypatch.setenv("PL_SNAPSHOT_PATH", str(tmp_path / "missing.plsnap"))
+
+    assert open_snapshot().squads == ["Arsenal", "Chelsea"]
+    # An explicit path never falls back
+    assert open_snapshot(str(tmp_path / "missing.plsnap")) is None
+
+
+def test_published_snapshot_beats_the_bundled_one(tmp_path, monkeypatch):
+    bundled = tmp_path / "bundle" / "team_stats.plsnap"
+    published = tmp_path / "team_stats.plsnap"
+    write(bundled, ["Arsenal", "Chelsea"])
+    write(published, ["Liverpool", "Everton", "Fulham"])
+    monkeypatch.setattr(snapshot, "BUNDLED_SNAPSHOT_PATH", str(bundled))
+    monkeypatch.setenv("PL_SNAPSHOT_PATH", str(published))
+
+    assert open_snapshot().squads == ["Liverpool", "Everton", "Fulham"]
+
+
+def test_no_snapshot_anywhere(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "BUNDLED_SNAPSHOT_PATH", str(tmp_path / "bundle.plsnap"))
+    monkeypatch.setenv("PL_SNAPSHOT_PATH", str(tmp_path / "missing.plsnap"))
+
+    assert open_snapshot() is None
+
+
+def test_odd_row_count_with_int8_and_bool_arrays(tmp_path):
+    squads = [f"Squad {i}" for i in range(19)]
+    comparison = np.arange(19 * 19 * 3, dtype=np.int8).reshape(19, 19, 3)
+    valid = comparison % 2 == 0
+    winners = np.ones((19, 19), dtype=np.int8)
+    path = str(tmp_path / "team_stats.plsnap")
+    write_snapshot(path, squads, {"Gls": list(range(19)), "xG": [0.5] * 19},
+                   arrays={"m:comparison": comparison, "m:valid": valid, "m:winners": winners})
+
+    assert os.path.getsize(path) % 8 == 0
+    loaded = load_snapshot(path)
+    assert loaded.squads == squads
+    assert list(loaded.column("Gls")) == list(range(19))
+    np.testing.assert_array_equal(np.asarray(loaded.array("m:comparison")), comparison)
+    np.testing.assert_array_equal(np.asarray(loaded.array("m:valid")), valid)
+    np.testing.assert_array_equal(np.asarray(loaded.array("m:winners")), winners)
+
+
+def test_corrupt_snapshot_falls_back_to_the_bundled_one(tmp_path, monkeypatch):
+    bundled = tmp_path / "bundle" / "team_stats.plsnap"
+    published = tmp_path / "team_stats.plsnap"
+    write(bundled, ["Arsenal", "Chelsea"])
+    write(published, ["Liverpool", "Everton", "Fulham"])
+    # Cut the file off in the middle of its column block
+    data = published.read_bytes()
+    published.write_bytes(data[:-12])
+    monkeypatch.setattr(snapshot, "BUNDLED_SNAPSHOT_PATH", str(bundled))
+    monkeypatch.setenv("PL_SNAPSHOT_PATH", str(published))
+
+    assert open_snapshot().squads == ["Arsenal", "Chelsea"]
+    assert open_snapshot(str(published)) is None
+
+
+def test_bad_header_is_a_value_error(tmp_path):
+    path = tmp_path / "team_stats.plsnap"
+    write(path, ["Arsenal"])
+    data = path.read_bytes().replace(b'"version"', b'"versiox"')
+    path.write_bytes(data)
+
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))